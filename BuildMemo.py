@@ -0,0 +1,83 @@
+import os
+from typing import Any, Hashable, Optional
+
+MEMO_FORMAT = 2
+
+
+class BuildMemo:
+    """Solved character builds by a canonical key, so a build copied into many configs is solved once
+
+    Entries are kept in insertion order and the oldest are dropped beyond max_entries.
+
+    Args:
+        path (str): file the memo is loaded from and saved to, None to keep it in memory only
+        max_entries (int): most entries kept in memory and saved
+        track_added (bool): remember the entries put since the last take_added
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1_000_000, track_added: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries: dict[Hashable, Any] = {}
+        self.added: Optional[dict[Hashable, Any]] = {} if track_added else None
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        return self.entries.get(key)
+
+    def put(self, key: Hashable, value: Any):
+        self.entries[key] = value
+        if self.added is not None:
+            self.added[key] = value
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+
+    def take_added(self) -> dict[Hashable, Any]:
+        """The entries put since the last call, e.g. to send them from a worker process to the main process"""
+        added, self.added = self.added, {}
+        return added or {}
+
+    def merge(self, entries: dict[Hashable, Any], hits: int = 0, misses: int = 0):
+        """Adds the entries and lookups of another memo, e.g. of a worker process"""
+        for key, value in entries.items():
+            self.put(key, value)
+        self.hits += hits
+        self.misses += misses
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def ratio(self) -> float:
+        """Builds looked up per build solved"""
+        return max(self.lookups, 1) / max(self.misses, 1)
+
+    def summary(self) -> str:
+        return (f"Builds: {self.lookups} looked up, {self.misses} solved, "
+                f"{self.ratio:.1f}x deduplicated")
+
+    def load(self):
+        """Loads the saved entries, a missing or unreadable file leaves the memo empty"""
+        import pickle
+        try:
+            with open(self.path, "rb") as file:
+                version, entries = pickle.load(file)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError, AttributeError, ImportError):
+            return
+        if version == MEMO_FORMAT and isinstance(entries, dict):
+            self.entries.update(entries)
+
+    def save(self):
+        import pickle
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as file:
+            pickle.dump((MEMO_FORMAT, self.entries), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
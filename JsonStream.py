@@ -0,0 +1,139 @@
+import json
+import re
+from typing import AsyncIterable, BinaryIO, Optional
+
+_STRUCTURAL = re.compile(rb'["\[\]{}]')
+_STRING_END = re.compile(rb'["\\]')
+# longest top level key worth remembering, longer strings cannot be the key we look for
+_MAX_KEY = 64
+_DECODER = json.JSONDecoder()
+
+
+class TopLevelArrayScanner:
+    """Finds the array stored under a key of the top level JSON object in a document fed in chunks
+
+    Only the structure of the document is tracked (nesting depth and whether the scanner is inside a string),
+    up to the key. An array that is complete within the chunk it starts in, the common case, is found by the C
+    decoder. Otherwise its bytes are kept and its structure is tracked until its closing bracket, so every byte
+    is looked at once however the document is split into chunks. feed returns True as soon as the array is
+    complete, so the rest of the document, e.g. the statistics of a gcsim result, never has to be read.
+    """
+
+    def __init__(self, key: str = "character_details"):
+        self.key = key.encode()
+        self.done = False
+        self._depth = 0
+        self._object = False  # the top level value is an object
+        self._in_string = False
+        self._escape = False
+        self._string: Optional[bytearray] = None  # a string at depth 1 that may be the key
+        self._pending = False  # the key was just read, its value comes next
+        self._capture: Optional[bytearray] = None
+        self._raw: Optional[bytes] = None
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.done:
+            return True
+        start = 0  # where the bytes of the array begin in this chunk
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._append_string(chunk[pos:pos + 1])
+                    pos += 1
+                    continue
+                m = _STRING_END.search(chunk, pos)
+                if m is None:
+                    self._append_string(chunk[pos:])
+                    break
+                self._append_string(chunk[pos:m.start()])
+                pos = m.end()
+                if m.group() == b"\\":
+                    self._escape = True
+                    continue
+                self._in_string = False
+                if self._string is not None:
+                    self._pending = self._string == self.key
+                    self._string = None
+                continue
+            m = _STRUCTURAL.search(chunk, pos)
+            if m is None:
+                break
+            token = m.group()
+            pos = m.end()
+            pending, self._pending = self._pending, False
+            if token == b'"':
+                self._in_string = True
+                if self._depth == 1 and self._object:
+                    self._string = bytearray()
+            elif token in b"[{":
+                if self._depth == 0:
+                    self._object = token == b"{"
+                elif pending and token == b"[" and self._depth == 1:
+                    if self._decode_array(chunk[m.start():]):
+                        return True
+                    self._capture = bytearray()
+                    start = m.start()
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 1 and self._capture is not None:
+                    self._capture += chunk[start:pos]
+                    self._raw = bytes(self._capture)
+                    self.done = True
+                    return True
+                if self._depth == 0:
+                    # the document ended without the key
+                    self.done = True
+                    return True
+        if self._capture is not None:
+            self._capture += chunk[start:]
+        return False
+
+    def _decode_array(self, data: bytes) -> bool:
+        """Takes the array at the start of data if data holds all of it"""
+        # data may end inside a multi byte character after the array
+        text = data.decode("UTF-8", "replace")
+        try:
+            _, end = _DECODER.raw_decode(text)
+        except ValueError:
+            return False
+        self._raw = text[:end].encode("UTF-8")
+        self.done = True
+        return True
+
+    def _append_string(self, data: bytes):
+        if self._string is None:
+            return
+        if len(self._string) + len(data) > _MAX_KEY:
+            self._string = None
+        else:
+            self._string += data
+
+    def raw(self) -> Optional[bytes]:
+        """The JSON text of the array, None when the key was not found or the document ended inside the array"""
+        return self._raw
+
+
+def read_character_details(stream: BinaryIO, chunk_size: int = 1 << 16) -> Optional[bytes]:
+    """The JSON text of character_details in a gcsim result read from a binary stream, None when missing
+
+    Reading stops as soon as character_details has been consumed.
+    """
+    scanner = TopLevelArrayScanner()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk or scanner.feed(chunk):
+            return scanner.raw()
+
+
+async def read_character_details_async(chunks: AsyncIterable[bytes]) -> Optional[bytes]:
+    """The JSON text of character_details in a gcsim result arriving in chunks, e.g. from aiohttp's
+    iter_chunked, None when missing"""
+    scanner = TopLevelArrayScanner()
+    async for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    return scanner.raw()
@@ -0,0 +1,105 @@
+import mmap
+import os
+import sys
+import tarfile
+import zipfile
+from typing import Iterator, Optional
+
+from KQMCChecker import phase
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ZIP_SUFFIXES = (".zip",)
+# raised when an archive or bundle cannot be read, also part way through
+ARCHIVE_ERRORS = (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile)
+RELEASE_BYTES = 1 << 22
+
+
+def decode_document(name: str, data: bytes) -> Optional[str]:
+    """The text of a document read as bytes, None with a note on stderr when it is not UTF-8"""
+    try:
+        return data.decode("UTF-8")
+    except UnicodeDecodeError:
+        print(f"Skipping {name}, it is not UTF-8 text", file=sys.stderr)
+        return None
+
+
+def tar_documents(path: str) -> Iterator[tuple[str, str]]:
+    """Yields (archive:member, content) for every file in a tar archive, reading it as a stream"""
+    base = os.path.basename(path)
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            # TarFile remembers every member it has read, forget them to keep memory flat
+            archive.members.clear()
+            if not member.isfile():
+                continue
+            with phase("read"):
+                data = archive.extractfile(member).read()
+            name = f"{base}:{member.name}"
+            content = decode_document(name, data)
+            if content is not None:
+                yield name, content
+
+
+def zip_documents(path: str) -> Iterator[tuple[str, str]]:
+    """Yields (archive:member, content) for every file in a zip archive, one member at a time"""
+    base = os.path.basename(path)
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            with phase("read"):
+                data = archive.read(member)
+            name = f"{base}:{member.filename}"
+            content = decode_document(name, data)
+            if content is not None:
+                yield name, content
+
+
+def bundle_documents(path: str) -> Iterator[tuple[str, str]]:
+    """Yields (bundle:index, content) for every NUL separated config in a bundle file
+
+    The file is memory mapped and only one config is decoded at a time.
+    """
+    base = os.path.basename(path)
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            index = 0
+            released = 0
+            while start < len(data):
+                end = data.find(b"\0", start)
+                if end == -1:
+                    end = len(data)
+                with phase("read"):
+                    doc = data[start:end]
+                start = end + 1
+                if start - released >= RELEASE_BYTES and hasattr(mmap, "MADV_DONTNEED"):
+                    # drop the pages already read so resident memory stays flat for huge bundles
+                    length = (start - released) // mmap.PAGESIZE * mmap.PAGESIZE
+                    data.madvise(mmap.MADV_DONTNEED, released, length)
+                    released += length
+                if not doc.strip():
+                    continue
+                name = f"{base}:{index}"
+                index += 1
+                content = decode_document(name, doc)
+                if content is not None:
+                    yield name, content
+
+
+def documents(path: str, bundle: bool = False) -> Iterator[tuple[str, str]]:
+    """The configs stored in an archive, or in a bundle file when bundle is set
+
+    Raises:
+        ARCHIVE_ERRORS: when the archive cannot be read
+    """
+    lower = path.lower()
+    if lower.endswith(ZIP_SUFFIXES):
+        return zip_documents(path)
+    if lower.endswith(TAR_SUFFIXES):
+        return tar_documents(path)
+    if bundle:
+        return bundle_documents(path)
+    raise ValueError(f"{path} is not an archive")
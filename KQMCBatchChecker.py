@@ -0,0 +1,103 @@
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+import KQMCChecker as checker
+from KQMCChecker import ArtifactStats, main_stat_combinations
+from Stats import Rules, Stat
+
+STAT_COUNT = len(Stat)
+
+
+class _Tables(NamedTuple):
+    main: np.ndarray
+    has_sub: np.ndarray
+    avg: np.ndarray
+    guess_mains: np.ndarray  # guess x stat: how many times each guess uses a stat as main stat
+    guess_main_totals: np.ndarray
+    snap_tolerance: np.ndarray
+    max_subs: np.ndarray
+
+
+@lru_cache(maxsize=None)
+def _tables(rules: Rules) -> _Tables:
+    """The arrays check_batch broadcasts over, built from the rules a batch is checked against"""
+    main = np.frombuffer(rules.main, dtype=float)
+    avg_sub = np.frombuffer(rules.avg_sub, dtype=float)
+    has_sub = avg_sub > 0
+    combinations = main_stat_combinations(rules)
+    guess_mains = np.zeros((len(combinations), STAT_COUNT))
+    for i, guess in enumerate(combinations):
+        for stat in guess:
+            guess_mains[i, stat] += 1
+    max_subs = np.asarray(rules.max_subs, dtype=float)[np.minimum(guess_mains, 5).astype(int)]
+    return _Tables(main, has_sub, np.where(has_sub, avg_sub, 1.0), guess_mains, guess_mains * main,
+                   np.where(guess_mains > 0, main * rules.max_stat_error, 0.0), max_subs)
+
+
+def __getattr__(name: str):
+    if name == "GUESS_MAINS":
+        return _tables(checker.RULES).guess_mains
+    if name == "GUESS_MAIN_TOTALS":
+        return _tables(checker.RULES).guess_main_totals
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def stats_matrix(char_stats: Iterable[ArtifactStats]) -> np.ndarray:
+    """Stack the stats of many characters into an N x len(Stat) array"""
+    return np.frombuffer(bytearray().join(c.stats for c in char_stats), dtype=float).reshape(-1, STAT_COUNT)
+
+
+def _check_chunk(stats: np.ndarray, rules: Rules) -> tuple[np.ndarray, np.ndarray]:
+    t = _tables(rules)
+    error = rules.max_stat_error
+    # N x G x S leftovers after removing every candidate main stat vector
+    stats = stats[:, None, :]
+    leftover = stats - t.guess_main_totals
+    leftover = np.where(np.abs(leftover) < t.snap_tolerance, 0.0, leftover)
+
+    # guess must fit in the stats the character actually has (guess_main_stats)
+    capacity = np.floor(np.where(t.main > 0, stats * (1+error) / np.where(t.main > 0, t.main, 1), 0))
+    possible = np.all(t.guess_mains <= capacity, axis=2)
+
+    # leftovers on stats without sub values cannot be explained (get_subs_from_guess)
+    possible &= np.all(t.has_sub | (leftover == 0), axis=2)
+    subs = np.where(t.has_sub, np.round(leftover / t.avg), 0)
+    total = subs * t.avg + t.guess_main_totals
+    in_error = (total * (1-error) <= stats) & (stats <= total * (1+error))
+    possible &= np.all(in_error | ~t.has_sub, axis=2)
+
+    # sub counts have to match the KQMC allocation (checkKQMC)
+    possible &= subs.sum(axis=2) == rules.max_subs_total
+    in_bounds = (rules.allocated_subs_per_stat <= subs) & (subs <= t.max_subs)
+    possible &= np.all(in_bounds | ~t.has_sub, axis=2)
+
+    valid = possible.any(axis=1)
+    first = np.where(valid, possible.argmax(axis=1), -1)
+    return valid, first
+
+
+def check_batch(stats: np.ndarray, chunk_size: int = 256,
+                rules: Optional[Rules] = None) -> tuple[np.ndarray, np.ndarray]:
+    """Checks many characters for KQMC main/sub stats at once
+
+    Args:
+        stats (np.ndarray): N x len(Stat) array, see stats_matrix
+        chunk_size (int): characters evaluated per broadcast, bounds memory to chunk_size x 420 x len(Stat)
+        rules (Rules): the rules to check against, the rules of KQMCChecker (see use_rules) by default
+
+    Returns:
+        (valid, guess_index): a bool array with a verdict per character, and the index into
+        main_stat_combinations(rules) of the first valid guess, or -1 when there is none.
+        Unlike the per-character loop this does not look at artifact sets, so characters
+        with 4* sets have to be filtered by the caller.
+    """
+    rules = rules or checker.RULES
+    stats = np.asarray(stats, dtype=float).reshape(-1, STAT_COUNT)
+    valid = np.zeros(len(stats), dtype=bool)
+    first = np.full(len(stats), -1, dtype=np.intp)
+    for start in range(0, len(stats), chunk_size):
+        end = start + chunk_size
+        valid[start:end], first[start:end] = _check_chunk(stats[start:end], rules)
+    return valid, first
@@ -1,45 +1,100 @@
-
-import glob
 import re
 import sys
-import argparse
-import os
-import traceback
-from typing import List
+import math
+import time
+from array import array
+from typing import List, NamedTuple, Optional, Sequence, Union
 from itertools import product
-from dataclasses import dataclass, field
+from functools import lru_cache
+from dataclasses import dataclass, field, replace
 
-from Stats import Stat, main_values, avg_sub_values, flower_stats, feather_stats, sands_stats, hat_stats, goblet_stats
+from BuildMemo import BuildMemo
+from Profiling import Profiler, NO_PHASE
+import Stats
+from Stats import Rules, Stat, SLOT_NAMES
 
 DEBUG = False
 
 comment_regex = re.compile(r"#.*$", re.MULTILINE)
-add_stats_regex = re.compile(r"([a-zA-Z]+) +add +stats +")
 stat_regex = re.compile(r"([a-zA-Z%]+) *= *(\d*\.?\d*)")
-set_regex = re.compile(
-    r'([a-zA-Z]+) +add +set *= *"([a-zA-Z]*)" +count *= *(\d+)')
+# Statements are separated by ';' or newlines. Only 'add stats', 'add set', 'add weapon' and 'char' statements
+# are captured, comments are consumed whole so that nothing inside them starts a statement.
+config_scanner = re.compile(r"""
+    \#[^\n]*
+    | (?:^|;)[ \t]*(?P<char>[a-zA-Z]+)[ \t]+(?:
+        add[ \t]+(?:
+            stats[ \t]+(?P<stats>[^;\n\#]*)
+            | set[ \t]*=[ \t]*"(?P<set>[a-zA-Z]*)"[ \t]+count[ \t]*=[ \t]*(?P<count>\d+)
+            | weapon[ \t]*=[ \t]*"[^"\n]*"(?P<weapon>[^;\n\#]*)
+        )
+        | char(?P<params>[ \t][^;\n\#]*)
+    )
+""", re.MULTILINE | re.VERBOSE)
+cons_regex = re.compile(r"\bcons[ \t]*=[ \t]*(\d+)")
+refine_regex = re.compile(r"\brefine[ \t]*=[ \t]*(\d+)")
 
 PRINT_ONLY_FAILS = False
-ALLOCATED_SUBS_PER_STAT = 2
-DISTRIBUTED_STATS_PER_NON_STAT_MAIN = 2
-MAX_SUBS_TOTAL = 40
+EXACT = False
+# version of the checking logic, bump it with every change that can alter a verdict or a result so that cached
+# results of older versions are not used
+CHECKER_VERSION = 2
+# set to a Profiler to collect timings and counters
+PROFILER: Optional[Profiler] = None
+# set to a BuildMemo to solve every distinct character build only once
+MEMO: Optional[BuildMemo] = None
+# the rules checks use unless they are given others, see use_rules and current_rules
+_rules: Optional[Rules] = None
+
+
+def current_rules() -> Rules:
+    """The rules checks use unless they are given others, also available as RULES
+
+    Stats.default_rules until use_rules selects others, loaded on first use to keep imports fast.
+    """
+    global _rules
+    if _rules is None:
+        _rules = Stats.default_rules()
+    return _rules
 
 
 @dataclass
 class ArtifactSet:
+    __slots__ = ("name", "count")
     name: str
     count: int
 
+    def __post_init__(self):
+        self.name = sys.intern(self.name)
+
+
+_NO_STATS = array("d", [0.0]) * len(Stat)
+
 
-@dataclass
 class ArtifactStats:
-    stats: list[int] = field(default_factory=lambda: [0 for _ in Stat])
-    sets: list[ArtifactSet] = field(default_factory=lambda: [])
+    """The summed stats of a character as a flat array of doubles indexed by Stat, its artifact sets, and its
+    constellation and weapon refinement (gcsim's defaults C0 and R1 when the config does not set them)"""
+    __slots__ = ("stats", "sets", "cons", "refine")
+
+    def __init__(self, stats=None, sets: Optional[List[ArtifactSet]] = None, cons: int = 0, refine: int = 1):
+        self.stats = array("d", stats) if stats is not None else _NO_STATS[:]
+        self.sets = sets if sets is not None else []
+        self.cons = cons
+        self.refine = refine
+
+    def __eq__(self, other):
+        if not isinstance(other, ArtifactStats):
+            return NotImplemented
+        return (self.stats == other.stats and self.sets == other.sets
+                and self.cons == other.cons and self.refine == other.refine)
+
+    def __repr__(self):
+        return (f"ArtifactStats(stats={self.stats.tolist()}, sets={self.sets}, "
+                f"cons={self.cons}, refine={self.refine})")
 
 
 def preprocess_file(file_content: str):
     file_content, _ = re.subn(comment_regex, "", file_content)
-    file_content.replace(";", ";\n")
+    file_content = file_content.replace(";", ";\n")
     lines = [x.strip() for x in file_content.splitlines()]
     return lines
 
@@ -57,44 +112,61 @@ def parse_json(jason: dict) -> dict[str, ArtifactStats]:
                 set_num = set_num // 2 * 2
                 char_stats[char_name].sets.append(
                     ArtifactSet(set_name, set_num))
+        char_stats[char_name].cons = char_det.get("cons") or 0
+        char_stats[char_name].refine = (char_det.get("weapon") or {}).get("refine") or 1
     return char_stats
 
 
-def parse_lines(lines: List[str]):
+def parse_config(file_content: str) -> dict[str, ArtifactStats]:
+    """Parses the 'add stats' and 'add set' statements of a config in a single scan"""
     char_stats: dict[str, ArtifactStats] = dict()
-    for line in lines:
-        add_stats_match = re.match(add_stats_regex, line)
-        if add_stats_match:
-            char_name = add_stats_match.groups()[0]
-            if char_name not in char_stats.keys():
-                char_stats[char_name] = ArtifactStats()
-            stats_data = line.split("stats")[-1]
-            for stats_match in re.finditer(stat_regex, stats_data):
-                stat = Stat.parse_stat(stats_match.groups()[0])
-                value = float(stats_match.groups()[1])
-                char_stats[char_name].stats[stat] += value
-                add_stats_match = re.match(add_stats_regex, line)
-
-        set_match = re.match(set_regex, line)
-        if set_match:
-            char_name = set_match.groups()[0]
-            if char_name not in char_stats.keys():
-                char_stats[char_name] = ArtifactStats()
-            set_name = set_match.groups()[1].lower()
-            set_num = int(set_match.groups()[2]) // 2 * 2
-            if set_num != 0:
-                char_stats[char_name].sets.append(
-                    ArtifactSet(set_name, set_num))
-
+    text_to_stat = current_rules().text_to_stat
+    # only characters with stats or sets are checked, their cons and weapon are filled in at the end
+    char_params: dict[str, str] = {}
+    weapon_params: dict[str, str] = {}
+    for match in config_scanner.finditer(file_content):
+        char_name = match.group("char")
+        if char_name is None:
+            continue
+        if match.group("params") is not None:
+            char_params[char_name] = match.group("params")
+            continue
+        if match.group("weapon") is not None:
+            weapon_params[char_name] = match.group("weapon")
+            continue
+        if char_name not in char_stats:
+            char_stats[char_name] = ArtifactStats()
+        stats_data = match.group("stats")
+        if stats_data is not None:
+            stats = char_stats[char_name].stats
+            for stat_text, value in stat_regex.findall(stats_data):
+                stats[text_to_stat.get(stat_text, Stat.nothing)] += float(value)
+            continue
+        set_num = int(match.group("count")) // 2 * 2
+        if set_num != 0:
+            char_stats[char_name].sets.append(
+                ArtifactSet(match.group("set").lower(), set_num))
+
+    for char_name, param_text in char_params.items():
+        cons = cons_regex.search(param_text)
+        if cons is not None and char_name in char_stats:
+            char_stats[char_name].cons = int(cons.group(1))
+    for char_name, param_text in weapon_params.items():
+        refine = refine_regex.search(param_text)
+        if refine is not None and char_name in char_stats:
+            char_stats[char_name].refine = int(refine.group(1))
     return char_stats
 
 
-four_star_arti_sets = {"instructor", "scholar", "theexile", "exile"}
-MAX_STAT_ERROR = 0.005
+def parse_lines(lines: List[str]):
+    return parse_config("\n".join(lines))
+
+
+STAT_COUNT = len(Stat)
 
 
 def check_main_stats_possible(equip_stats: tuple[Stat, Stat, Stat, Stat, Stat], possible_main_stats: List[int]) -> bool:
-    used = [0 for _ in Stat]
+    used = [0] * STAT_COUNT
     for stat in equip_stats:
         used[stat] += 1
         if possible_main_stats[stat] - used[stat] < 0:
@@ -102,251 +174,731 @@ def check_main_stats_possible(equip_stats: tuple[Stat, Stat, Stat, Stat, Stat],
     return True
 
 
-def guess_main_stats(char_stats: ArtifactStats) -> list[tuple[Stat, Stat, Stat, Stat, Stat]]:
+@lru_cache(maxsize=None)
+def stat_table(rules: Rules) -> tuple[tuple[Stat, float, float, float, float], ...]:
+    """(stat, main value, main value tolerance, average sub value, its reciprocal) for every Stat, 0 where the
+    stat has no main or sub value, so the guess loop does no lookups"""
+    return tuple((stat, rules.main[stat], rules.main_tolerance[stat], rules.avg_sub[stat], rules.inv_avg_sub[stat])
+                 for stat in Stat)
+
+
+@lru_cache(maxsize=None)
+def slot_stats(rules: Rules) -> tuple[frozenset[Stat], ...]:
+    """The main stats of every slot, in SLOT_NAMES order"""
+    return tuple(rules.slot_stats(slot) for slot in range(len(SLOT_NAMES)))
+
+
+@lru_cache(maxsize=None)
+def main_stat_combinations(rules: Rules) -> tuple[tuple[Stat, Stat, Stat, Stat, Stat], ...]:
+    """Every flower/feather/sands/hat/goblet main stat combination"""
+    return tuple(product(*slot_stats(rules)))
+
+
+# Main stats from most to least commonly used in their slot, crit hats and elemental goblets first
+MAIN_STAT_LIKELIHOOD = (
+    Stat.cr, Stat.cd, Stat.pyro, Stat.hydro, Stat.electro, Stat.cryo, Stat.anemo, Stat.geo, Stat.dendro,
+    Stat.physical, Stat.atk_pcnt, Stat.er, Stat.em, Stat.hp_pcnt, Stat.defd_pcnt, Stat.heal, Stat.hp, Stat.atk,
+)
+
+
+def _likelihood(stat: Stat) -> int:
+    return MAIN_STAT_LIKELIHOOD.index(stat) if stat in MAIN_STAT_LIKELIHOOD else len(MAIN_STAT_LIKELIHOOD)
+
+
+@lru_cache(maxsize=None)
+def search_slots(rules: Rules) -> tuple[tuple[int, tuple[Stat, ...]], ...]:
+    """Slots in the order guesses are built, the most telling first: (position in a guess, main stats most likely
+    first)"""
+    slots = slot_stats(rules)
+    return tuple((position, tuple(sorted(slots[position], key=_likelihood))) for position in (4, 3, 2, 0, 1))
+
+
+@lru_cache(maxsize=None)
+def _main_stat_index(rules: Rules) -> tuple[tuple[Stat, ...], tuple[int, ...], tuple[tuple[int, ...], ...]]:
+    main_stats = tuple(sorted(frozenset().union(*slot_stats(rules))))
+    requirements = tuple(
+        tuple(combo.count(stat) for stat in main_stats) for combo in main_stat_combinations(rules))
+    max_uses = tuple(map(max, zip(*requirements)))
+    return main_stats, max_uses, requirements
+
+
+def main_stat_index(rules: Optional[Rules] = None) -> tuple[tuple[Stat, ...], tuple[int, ...], tuple[tuple[int, ...], ...]]:
+    """Built on first use to keep imports fast
+
+    Returns:
+        (MAIN_STATS, MAX_MAIN_STAT_USES, MAIN_STAT_REQUIREMENTS): the stats that can appear as a main stat,
+        how many slots each can occupy at most, and the number of times each combination uses every one of them
+    """
+    return _main_stat_index(rules or current_rules())
+
+
+# the values of the current rules under their old names
+_RULES_CONSTANTS = {
+    "ALLOCATED_SUBS_PER_STAT": lambda rules: rules.allocated_subs_per_stat,
+    "DISTRIBUTED_STATS_PER_NON_STAT_MAIN": lambda rules: rules.distributed_subs_per_non_stat_main,
+    "MAX_SUBS_TOTAL": lambda rules: rules.max_subs_total,
+    "MAX_ROLLS": lambda rules: rules.max_subs_total,
+    "MAX_STAT_ERROR": lambda rules: rules.max_stat_error,
+    # Substat roll tiers in percent of the 5* max roll: 70-100% of a 5* roll, and of a 4* roll (80% of a 5* roll)
+    "ROLL_TIER_UNITS": lambda rules: rules.roll_tier_units,
+    "four_star_arti_sets": lambda rules: set(rules.four_star_sets),
+    "MAIN_STAT_COMBINATIONS": main_stat_combinations,
+    "SEARCH_SLOTS": search_slots,
+}
+
+
+def __getattr__(name: str):
+    """RULES, the constants derived from it and the main stat tables are built on first use"""
+    index_names = ("MAIN_STATS", "MAX_MAIN_STAT_USES", "MAIN_STAT_REQUIREMENTS")
+    if name in index_names:
+        return main_stat_index()[index_names.index(name)]
+    if name == "RULES":
+        return current_rules()
+    if name in _RULES_CONSTANTS:
+        return _RULES_CONSTANTS[name](current_rules())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main_stat_capacity(possible_main_stats: List[int], rules: Optional[Rules] = None) -> tuple[int, ...]:
+    """Capacity vector over MAIN_STATS, capped at what any combination can use"""
+    main_stats, max_main_stat_uses, _ = main_stat_index(rules)
+    return tuple(min(possible_main_stats[stat], max_uses)
+                 for stat, max_uses in zip(main_stats, max_main_stat_uses))
+
+
+@lru_cache(maxsize=None)
+def _lookup_main_stats(capacity: tuple[int, ...], rules: Rules) -> tuple[tuple[Stat, Stat, Stat, Stat, Stat], ...]:
+    available = dict(zip(_main_stat_index(rules)[0], capacity))
+    slots = search_slots(rules)
+    candidates = [[stat for stat in stats if available[stat] > 0] for _, stats in slots]
+    combos = []
+    for picks in product(*candidates):
+        if any(picks.count(stat) > available[stat] for stat in picks):
+            continue
+        guess = [Stat.nothing] * 5
+        for (position, _), stat in zip(slots, picks):
+            guess[position] = stat
+        combos.append(tuple(guess))
+    return tuple(combos)
+
+
+def lookup_main_stats(capacity: tuple[int, ...], rules: Optional[Rules] = None) -> tuple[tuple[Stat, Stat, Stat, Stat, Stat], ...]:
+    """All main stat combinations that fit in the given capacity vector, most likely first
+
+    Combinations are built slot by slot from the main stats the capacity has room for, so only the few
+    combinations near the capacity are visited instead of all of MAIN_STAT_COMBINATIONS.
+    """
+    return _lookup_main_stats(capacity, rules or current_rules())
+
+
+def guess_main_stats(char_stats: ArtifactStats, rules: Optional[Rules] = None) -> list[tuple[Stat, Stat, Stat, Stat, Stat]]:
+    """Every main stat combination the stats have room for, most likely first"""
+    rules = rules or current_rules()
     for set in char_stats.sets:
-        if set.name in four_star_arti_sets:
+        if set.name in rules.four_star_sets:
             debug(f"The 4* set {set.name} is not implemented for checking")
             raise NotImplementedError
-    possible_main_stats = [0 for _ in Stat]
-    for stat in Stat:
-        if main_values[stat] is not None and char_stats.stats[stat] * (1+MAX_STAT_ERROR) >= main_values[stat]:
-            possible_main_stats[stat] = int(
-                char_stats.stats[stat] * (1+MAX_STAT_ERROR) / main_values[stat])
-    valid_guesses = []
-
-    perms = product(
-        flower_stats,
-        feather_stats,
-        sands_stats,
-        hat_stats,
-        goblet_stats
-    )
-
-    for equip_stats in perms:
-        if not check_main_stats_possible(equip_stats, possible_main_stats):
+    stats = char_stats.stats
+    scale = rules.capacity_scale
+    main_stats, max_main_stat_uses, _ = _main_stat_index(rules)
+    capacity = tuple(min(int(stats[stat] * scale[stat]), max_uses)
+                     for stat, max_uses in zip(main_stats, max_main_stat_uses))
+    return list(_lookup_main_stats(capacity, rules))
+
+
+class Failure(NamedTuple):
+    """Why a main stat guess was rejected, only formatted into a message when it is displayed"""
+    kind: str
+    args: tuple
+
+    def __str__(self):
+        return _FAILURE_MESSAGES[self.kind](*self.args)
+
+
+_FAILURE_MESSAGES = {
+    "leftover": lambda stat: f"'{stat}' has leftover stats that cannot be filled by sub stats",
+    "subs": lambda stat, subs: f"Cannot find integer subs. '{stat}' has {subs:.3f} subs",
+    "total": lambda total, expected: f"Total sub count is {total} but expected {expected}",
+    "bounds": lambda stat, subs, min_subs, max_subs: f"'{stat}' has {subs} substats but expected {min_subs} to {max_subs} subs",
+    "rolls": lambda stat: f"'{stat}' cannot be made of whole substat rolls",
+    "roll_bounds": lambda stat, rolls, min_subs, max_subs: f"'{stat}' needs {rolls} substat rolls but expected {min_subs} to {max_subs} subs",
+    "roll_total": lambda expected: f"No combination of substat rolls adds up to {expected} subs",
+}
+
+
+@lru_cache(maxsize=None)
+def guess_main_counts(guess: tuple[Stat, Stat, Stat, Stat, Stat]) -> tuple[int, ...]:
+    """How many slots of the guess have each Stat as main stat"""
+    counts = [0] * STAT_COUNT
+    for stat in guess:
+        counts[stat] += 1
+    return tuple(counts)
+
+
+def _leftover(value: float, main_value: float, tolerance: float, count: int) -> float:
+    """What is left of a stat after taking count main stats out of it, snapped to 0 when within the tolerance"""
+    for _ in range(count):
+        value -= main_value
+        if (-tolerance < value < tolerance):
+            value = 0
+    return value
+
+
+def _subs_or_failure(char_stat: ArtifactStats, guess: tuple[Stat, Stat, Stat, Stat, Stat], rules: Rules) -> Union[list[int], Failure]:
+    stats = char_stat.stats
+    mains = guess_main_counts(guess)
+    low = 1 - rules.max_stat_error
+    high = 1 + rules.max_stat_error
+    subs = [0] * STAT_COUNT
+    for stat, main_value, tolerance, avg_sub_value, inv_avg_sub_value in stat_table(rules):
+        value = stats[stat]
+        count = mains[stat]
+        leftover = _leftover(value, main_value, tolerance, count) if count else value
+        if not avg_sub_value:
+            if leftover != 0:
+                return Failure("leftover", (stat,))
             continue
-        valid_guesses.append(equip_stats)
+        sub_count = round(leftover * inv_avg_sub_value)
+        calculated_stat_total = sub_count * avg_sub_value + count * main_value
+        if not (calculated_stat_total * low <= value <= calculated_stat_total * high):
+            return Failure("subs", (stat, leftover * inv_avg_sub_value))
+        subs[stat] = sub_count
+    return subs
 
-    return valid_guesses
 
+def get_subs_from_guess(char_stat: ArtifactStats, guess: tuple[Stat, Stat, Stat, Stat, Stat], rules: Optional[Rules] = None):
+    subs = _subs_or_failure(char_stat, guess, rules or current_rules())
+    if isinstance(subs, Failure):
+        raise ValueError(str(subs))
+    return subs
 
-def get_subs_from_guess(char_stat: ArtifactStats, guess: tuple[Stat, Stat, Stat, Stat, Stat]):
-    stats = char_stat.stats.copy()
-    mains = [0 for _ in Stat]
-    for stat in guess:
-        stats[stat] -= main_values[stat]
-        mains[stat] += 1
-        if (-main_values[stat]*MAX_STAT_ERROR < stats[stat] < main_values[stat]*MAX_STAT_ERROR):
-            stats[stat] = 0
-
-    subs = [0 for _ in Stat]
-    for stat in Stat:
-        if stats[stat] != 0 and avg_sub_values[stat] == None:
-            raise ValueError(
-                f"'{stat}' has leftover stats that cannot be filled by sub stats")
-        if avg_sub_values[stat] != None:
-            sub_count = round(stats[stat]/avg_sub_values[stat])
-            calculated_stat_total = sub_count * \
-                avg_sub_values[stat] + ((mains[stat] * main_values[stat])
-                                        if (mains[stat] != 0) else 0)
-            msg = f"Cannot find integer subs. "
-            err = False
-            if not (calculated_stat_total * (1-MAX_STAT_ERROR) <= char_stat.stats[stat] <= calculated_stat_total * (1+MAX_STAT_ERROR)):
-                msg += f"'{stat}' has {stats[stat]/avg_sub_values[stat]:.3f} subs"
-                err = True
-            if err:
-                raise ValueError(msg)
-            subs[stat] = sub_count
+
+def _kqmc_failure(mains, subs, rules: Rules) -> Optional[Failure]:
+    total = sum(subs)
+    if total != rules.max_subs_total:
+        return Failure("total", (total, rules.max_subs_total))
+    counts = guess_main_counts(tuple(mains))
+    min_subs = rules.allocated_subs_per_stat
+    max_subs = rules.max_subs
+    for stat in rules.sub_stats:
+        if not (min_subs <= subs[stat] <= max_subs[counts[stat]]):
+            return Failure("bounds", (Stat(stat), subs[stat], min_subs, max_subs[counts[stat]]))
+    return None
+
+
+def checkKQMC(mains, subs, rules: Optional[Rules] = None):
+    failure = _kqmc_failure(mains, subs, rules or current_rules())
+    if failure is not None:
+        return False, str(failure)
+    return True, ""
+
+
+@lru_cache(maxsize=None)
+def _roll_count_table(roll_tier_units: tuple[int, ...], max_rolls: int) -> tuple[int, ...]:
+    tiers = sorted(set(roll_tier_units))
+    table = [0 for _ in range(max_rolls * max(tiers) + 1)]
+    reachable = 1  # bit n: a total of n units is reachable with k rolls
+    for k in range(max_rolls + 1):
+        n = 0
+        remaining = reachable
+        while remaining:
+            if remaining & 1:
+                table[n] |= 1 << k
+            remaining >>= 1
+            n += 1
+        next_reachable = 0
+        for tier in tiers:
+            next_reachable |= reachable << tier
+        reachable = next_reachable
+    return tuple(table)
+
+
+def roll_count_table(rules: Optional[Rules] = None) -> tuple[int, ...]:
+    """For every total in roll tier units, a bitmask of the numbers of rolls that can reach exactly that total"""
+    rules = rules or current_rules()
+    return _roll_count_table(rules.roll_tier_units, rules.max_subs_total)
+
+
+def possible_roll_counts(stat: Stat, leftover: float, tolerance: float, rules: Optional[Rules] = None) -> int:
+    """Bitmask of the numbers of real substat rolls whose total is within tolerance of leftover"""
+    rules = rules or current_rules()
+    table = roll_count_table(rules)
+    unit = rules.roll_unit[stat]
+    low = max(0, math.ceil((leftover - tolerance) / unit))
+    high = min(len(table) - 1, math.floor((leftover + tolerance) / unit))
+    mask = 0
+    for n in range(low, high + 1):
+        mask |= table[n]
+    return mask
+
+
+def _exact_subs_or_failure(char_stat: ArtifactStats, guess: tuple[Stat, Stat, Stat, Stat, Stat], rules: Rules) -> Union[list[int], Failure]:
+    """Like _subs_or_failure, but only accepts substats made of whole rolls at the real roll tiers,
+    and picks roll counts that satisfy the KQMC substat limits"""
+    stats = char_stat.stats
+    mains = guess_main_counts(guess)
+    error = rules.max_stat_error
+    min_subs = rules.allocated_subs_per_stat
+    sub_stats = []
+    allowed = []
+    for stat, main_value, tolerance, avg_sub_value, _ in stat_table(rules):
+        value = stats[stat]
+        count = mains[stat]
+        leftover = _leftover(value, main_value, tolerance, count) if count else value
+        if not avg_sub_value:
+            if leftover != 0:
+                return Failure("leftover", (stat,))
+            continue
+        rolls = possible_roll_counts(stat, leftover, value * error, rules)
+        if rolls == 0:
+            return Failure("rolls", (stat,))
+        max_subs = rules.max_subs[count]
+        in_bounds = rolls & (((1 << (max_subs + 1)) - 1) ^ ((1 << min_subs) - 1))
+        if in_bounds == 0:
+            return Failure("roll_bounds", (stat, (rolls & -rolls).bit_length() - 1, min_subs, max_subs))
+        sub_stats.append(stat)
+        allowed.append(in_bounds)
+
+    # bit t of totals[i]: t subs can be distributed over the first i stats
+    totals = [1]
+    for mask in allowed:
+        total = 0
+        k = 0
+        while mask >> k:
+            if (mask >> k) & 1:
+                total |= totals[-1] << k
+            k += 1
+        totals.append(total)
+    if not (totals[-1] >> rules.max_subs_total) & 1:
+        return Failure("roll_total", (rules.max_subs_total,))
+
+    subs = [0] * STAT_COUNT
+    remaining = rules.max_subs_total
+    for i in reversed(range(len(sub_stats))):
+        k = 0
+        while not ((allowed[i] >> k) & 1 and remaining >= k and (totals[i] >> (remaining - k)) & 1):
+            k += 1
+        subs[sub_stats[i]] = k
+        remaining -= k
     return subs
 
 
-def check_json(jason: str, name="Unknown name"):
-    char_stats = parse_json(jason)
-    all_valid = True
-    msg = ""
-    for char in char_stats.keys():
-        possible_mains = []
+VALID = "valid"
+INVALID = "invalid"
+SKIPPED = "skipped"
+
+VERBOSITY_FAILURES = 0
+VERBOSITY_NORMAL = 1
+VERBOSITY_DEBUG = 2
+
+
+@dataclass
+class GuessResult:
+    guess: tuple[Stat, Stat, Stat, Stat, Stat]
+    subs: Optional[list[int]] = None
+    failure: Optional[Failure] = None
+
+    @property
+    def kqmc_failed(self) -> bool:
+        """The subs could be found, but they are not a KQMC distribution"""
+        return self.subs is not None and self.failure is not None
+
+
+@dataclass
+class CharacterResult:
+    name: str
+    verdict: str
+    note: str = ""
+    guesses: list[GuessResult] = field(default_factory=list)
+
+    @property
+    def decided_by(self) -> Optional[GuessResult]:
+        """The guess the verdict was decided on: the valid guess, or the most likely guess that only failed
+        the KQMC substat limits"""
+        if self.verdict == VALID:
+            return self.guesses[-1]
+        return next((g for g in self.guesses if g.kqmc_failed), None)
+
+    @property
+    def guess(self) -> Optional[tuple[Stat, Stat, Stat, Stat, Stat]]:
+        decided_by = self.decided_by
+        return decided_by.guess if decided_by is not None else None
+
+    @property
+    def subs(self) -> Optional[list[int]]:
+        decided_by = self.decided_by
+        return decided_by.subs if decided_by is not None else None
+
+    @property
+    def reason(self) -> str:
+        if self.verdict == VALID:
+            return ""
+        decided_by = self.decided_by
+        return str(decided_by.failure) if decided_by is not None else self.note
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "verdict": self.verdict,
+            "reason": self.reason,
+            "guess": [str(stat) for stat in self.guess] if self.guess is not None else None,
+            "subs": {str(Stat(stat)): self.subs[stat] for stat in current_rules().sub_stats}
+            if self.subs is not None else None,
+        }
+
+    def render(self, verbosity: int = VERBOSITY_NORMAL) -> str:
+        msg = ""
+        if verbosity >= VERBOSITY_DEBUG:
+            msg += self._render_debug()
+        if self.verdict == VALID:
+            return msg
+        if not self.guesses:
+            return msg + f"\t{self.name} {self.note}\n\n"
+        msg += f"\t{self.name} {self.note}\n"
+        if verbosity >= VERBOSITY_DEBUG:
+            return msg
+        decided_by = self.decided_by
+        shown = [decided_by] if decided_by is not None else self.guesses
+        err_m = [f"\t\t{g.guess}\n" + (f"\t\t\t{g.failure}" if g.failure is not None else "")
+                 for g in shown]
+        return msg + '\n'.join(err_m) + "\n\n"
+
+    def _render_debug(self) -> str:
+        if not self.guesses:
+            return f"{self.name} {self.note}\n"
+        lines = [
+            f"For character {self.name} found possible main stats combinations: "]
+        for g in self.guesses:
+            lines.append(f"\t{g.guess}")
+            if g.subs is None:
+                lines.append(
+                    f"\t\tThis main stat guess was invalid:\n {g.failure}")
+                continue
+            lines.append(f"\t\tsubs={g.subs}")
+            if g.failure is not None:
+                lines.append(
+                    f"\t\tThis main stat guess was invalid due to failing KQMC substat check: {g.failure}")
+        if self.verdict != VALID:
+            lines.append(f"{self.name} {self.note}")
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class ConfigResult:
+    name: str
+    characters: list[CharacterResult] = field(default_factory=list)
+    standard: str = "KQMC"
+
+    @property
+    def valid(self) -> bool:
+        return all(c.verdict != INVALID for c in self.characters)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "standard": self.standard,
+            "valid": self.valid,
+            "characters": [c.to_dict() for c in self.characters],
+        }
+
+    def render(self, verbosity: int = VERBOSITY_NORMAL, quote_name: bool = True) -> str:
+        """Human readable report, an empty string for valid configs when only failures are requested"""
+        name = f"'{self.name}'" if quote_name else self.name
+        if self.valid:
+            if verbosity <= VERBOSITY_FAILURES:
+                return ""
+            msg = f"{name} is {self.standard} valid\n"
+        else:
+            msg = f"{name} is not {self.standard} valid\n"
+        return msg + "".join(c.render(verbosity) for c in self.characters)
+
+
+@dataclass
+class StandardsResult:
+    """The results of one config under several standards, checked in one pass"""
+    name: str
+    standards: list[ConfigResult] = field(default_factory=list)
+
+    @property
+    def valid(self) -> bool:
+        return all(r.valid for r in self.standards)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "valid": self.valid,
+            "standards": [{k: v for k, v in r.to_dict().items() if k != "name"} for r in self.standards],
+        }
+
+    def render(self, verbosity: int = VERBOSITY_NORMAL, quote_name: bool = True) -> str:
+        return "".join(replace(r, name=self.name).render(verbosity, quote_name) for r in self.standards)
+
+
+def verdict_changes(before: Optional[ConfigResult], after: Optional[ConfigResult]) -> list[tuple[str, str, str]]:
+    """(character, verdict before, verdict after) of every character whose verdict differs
+
+    Characters missing from before are "new", characters missing from after are "removed".
+    """
+    old = {c.name: c.verdict for c in before.characters} if before is not None else {}
+    new = {c.name: c.verdict for c in after.characters} if after is not None else {}
+    changes = [(char, old.get(char, "new"), verdict) for char, verdict in new.items() if old.get(char) != verdict]
+    changes += [(char, verdict, "removed") for char, verdict in old.items() if char not in new]
+    return changes
+
+
+def phase(name: str):
+    """Times a phase when profiling is enabled"""
+    return PROFILER.phase(name) if PROFILER is not None else NO_PHASE
+
+
+def check_character(char: str, char_stats: ArtifactStats, rules: Optional[Rules] = None) -> CharacterResult:
+    """Checks one character, recording every main stat guess that was tried and why it failed"""
+    return check_character_standards(char, char_stats, (rules or current_rules(),))[0]
+
+
+def check_character_standards(char: str, char_stats: ArtifactStats, standards: Sequence[Rules]) -> list[CharacterResult]:
+    """Checks one character against every standard, see _check_character"""
+    if PROFILER is None:
+        return _check_character(char, char_stats, tuple(standards))
+    start = time.perf_counter()
+    results = _check_character(char, char_stats, tuple(standards))
+    PROFILER.characters.append((time.perf_counter() - start, char))
+    PROFILER.count("characters")
+    PROFILER.count("guesses evaluated", max(len(r.guesses) for r in results))
+    PROFILER.count("rejected by get_subs_from_guess",
+                   max(sum(g.subs is None for g in r.guesses) for r in results))
+    PROFILER.count("rejected by checkKQMC",
+                   sum(g.kqmc_failed for r in results for g in r.guesses))
+    return results
+
+
+def _limit_failure(char: str, char_stats: ArtifactStats, rules: Rules) -> Optional[str]:
+    """Why the constellation or weapon of a character breaks the limits of a standard, None when it does not"""
+    if rules.max_refine is not None and char_stats.refine > rules.max_refine:
+        return f"has an R{char_stats.refine} weapon but {rules.name} allows at most R{rules.max_refine}"
+    if rules.max_cons_four_star is None and rules.max_cons_five_star is None:
+        return None
+    if char.lower() in rules.five_star_characters:
+        max_cons, rarity = rules.max_cons_five_star, 5
+    elif char.lower() in rules.four_star_characters:
+        max_cons, rarity = rules.max_cons_four_star, 4
+    elif rules.max_cons_four_star == rules.max_cons_five_star:
+        max_cons, rarity = rules.max_cons_four_star, 4
+    else:
+        # fail closed, a new 5* character must not pass as a 4* one
+        return f"has an unknown rarity, {rules.name} limits 4* and 5* characters differently"
+    if max_cons is not None and char_stats.cons > max_cons:
+        return f"is C{char_stats.cons} but {rules.name} allows at most C{max_cons} for {rarity}* characters"
+    return None
+
+
+@lru_cache(maxsize=None)
+def _standard_groups(standards: tuple[Rules, ...], exact: bool) -> tuple[tuple[int, ...], ...]:
+    """Indices of the standards that share main stat guesses and subs, i.e. only differ in the KQMC limits"""
+    groups: dict[tuple, list[int]] = {}
+    for i, rules in enumerate(standards):
+        key = (rules.main_values, rules.max_sub_values, rules.avg_sub_multiplier, rules.max_stat_error,
+               rules.slot_masks, rules.four_star_sets)
+        if exact:
+            # the exact subs already pick roll counts within the limits
+            key += (rules.roll_tier_units, rules.max_subs_total, rules.max_subs, rules.allocated_subs_per_stat)
+        groups.setdefault(key, []).append(i)
+    return tuple(tuple(group) for group in groups.values())
+
+
+def _check_character(char: str, char_stats: ArtifactStats, standards: tuple[Rules, ...]) -> list[CharacterResult]:
+    """Checks one character against every standard in one pass
+
+    Standards that agree on the stat values share the main stat guesses and the subs of every guess, only the
+    KQMC limits are evaluated per standard.
+    """
+    if len(standards) == 1:
+        note = _limit_failure(char, char_stats, standards[0])
+        if note is not None:
+            return [CharacterResult(char, INVALID, note)]
+        return _solve(char, char_stats, standards)
+    results: list[Optional[CharacterResult]] = [None] * len(standards)
+    for group in _standard_groups(standards, EXACT):
+        pending = []
+        for i in group:
+            note = _limit_failure(char, char_stats, standards[i])
+            if note is not None:
+                results[i] = CharacterResult(char, INVALID, note)
+            else:
+                pending.append(i)
+        if pending:
+            checked = _solve(char, char_stats, tuple(standards[i] for i in pending))
+            for i, result in zip(pending, checked):
+                results[i] = result
+    return results
+
+
+# builds whose stats round to the same multiples of this are the same build, e.g. the same lines summed in another
+# order
+BUILD_QUANTUM = 1e-9
+# adding this rounds a float below 2**51 in magnitude to a whole number, several times faster than round
+_ROUNDER = 1.5 * 2 ** 52
+
+
+@lru_cache(maxsize=None)
+def _memo_version(standards: tuple[Rules, ...], exact: bool) -> str:
+    return rules_version(standards)
+
+
+def _build_key(stats: array) -> tuple[float, ...]:
+    """The stats as whole multiples of BUILD_QUANTUM, offset by _ROUNDER"""
+    return tuple([value / BUILD_QUANTUM + _ROUNDER for value in stats])
+
+
+def _solve(char: str, char_stats: ArtifactStats, standards: tuple[Rules, ...]) -> list[CharacterResult]:
+    """_check_guesses, answered from MEMO when the same build was solved before
+
+    Builds are the same when they have the same sets and their stats round to the same multiples of
+    BUILD_QUANTUM, so copies that only differ by float rounding share one entry. Copies whose stats fall on both
+    sides of a rounding boundary are solved separately. With DEBUG every build is solved, so the debug output is
+    the same as without MEMO.
+    """
+    if MEMO is None or DEBUG:
+        return _check_guesses(char, char_stats, standards)
+    sets = tuple(sorted([(s.name, s.count) for s in char_stats.sets]))
+    key = (_memo_version(standards, EXACT), _build_key(char_stats.stats), sets)
+    results = MEMO.get(key)
+    if results is None:
+        MEMO.misses += 1
+        results = _check_guesses(char, char_stats, standards)
+        MEMO.put(key, results)
+        return results
+    MEMO.hits += 1
+    if PROFILER is not None:
+        PROFILER.count("builds deduplicated")
+    return [replace(r, name=char) if r.name != char else r for r in results]
+
+
+def _check_guesses(char: str, char_stats: ArtifactStats, standards: Sequence[Rules]) -> list[CharacterResult]:
+    rules = standards[0]
+    with phase("guess_main_stats"):
         try:
-            possible_mains = guess_main_stats(char_stats[char])
+            possible_mains = guess_main_stats(char_stats, rules)
         except NotImplementedError:
-            debug(
-                f"{char} has 4* set. Skipping this character. Please confirm manually")
-            msg += f"\t{char} has 4* set. Skipping this character. Please confirm manually\n\n"
-            continue
-        if len(possible_mains) == 0:
-            debug(f"{char} does not have 5 possible main stats")
-            msg += f"\t{char} does not have 5 possible main stats\n\n"
-            all_valid = False
-            continue
-        debug(f"For character {char} found possible main stats combinations: ")
-        err_m = []
-        char_is_valid = False
+            return [CharacterResult(char, SKIPPED, "has 4* set. Skipping this character. Please confirm manually")
+                    for _ in standards]
+    if PROFILER is not None:
+        PROFILER.count("guesses enumerated", len(possible_mains))
+    if len(possible_mains) == 0:
+        return [CharacterResult(char, INVALID, "does not have 5 possible main stats") for _ in standards]
+    results = [CharacterResult(char, INVALID, "isn't valid KQMC mains/substats") for _ in standards]
+    pending = list(zip(standards, results))
+    subs_or_failure = _exact_subs_or_failure if EXACT else _subs_or_failure
+    with phase("guess loop"):
         for guess in possible_mains:
-            debug(f"\t{guess}")
-            err_m.append(f"\t\t{guess}\n")
-            if char_is_valid:
-                debug(
-                    "\t\tSkipping because a valid KQMC main/substat distribution has been found already")
+            subs = subs_or_failure(char_stats, guess, rules)
+            if isinstance(subs, Failure):
+                failed = GuessResult(guess, failure=subs)
+                for _, result in pending:
+                    result.guesses.append(failed)
                 continue
-            try:
-                subs = get_subs_from_guess(char_stats[char], guess)
-                debug(f"\t\t{subs=}")
-            except ValueError as e:
-                debug(
-                    f"\t\tThis main stat guess was invalid:\n {e}")
-                err_m[-1] += f"\t\t\t{e}"
-                continue
-            check, kqmc_msg = checkKQMC(guess, subs)
-            char_is_valid = char_is_valid or check
-            if not check:
-                debug(
-                    f"\t\tThis main stat guess was invalid due to failing KQMC substat check: {kqmc_msg}")
-                err_m = [err_m[-1] + f"\t\t\t{kqmc_msg}"]
+            still_pending = []
+            for standard, result in pending:
+                failure = _kqmc_failure(guess, subs, standard)
+                result.guesses.append(GuessResult(guess, subs, failure))
+                if failure is None:
+                    result.verdict = VALID
+                else:
+                    still_pending.append((standard, result))
+            pending = still_pending
+            if not pending:
                 break
-        if not char_is_valid:
-            debug(f"{char} isn't valid KQMC mains/substats")
-            msg += f"\t{char} isn't valid KQMC mains/substats\n"
-            if not DEBUG:
-                msg += '\n'.join(err_m) + "\n\n"
-        all_valid = all_valid and char_is_valid
-
-    if all_valid:
-        if not PRINT_ONLY_FAILS:
-            msg = f"{name} is KQMC valid\n" + msg
-        else:
-            msg = ""
-    else:
-        msg = f"{name} is not KQMC valid\n" + msg
+    return results
 
-    return msg
 
+def check_characters(char_stats: dict[str, ArtifactStats], name="Unknown name", rules: Optional[Rules] = None) -> ConfigResult:
+    rules = rules or current_rules()
+    return ConfigResult(name, [check_character(char, stats, rules) for char, stats in char_stats.items()], rules.name)
 
-def checkKQMC(mains, subs):
-    if sum(subs) != MAX_SUBS_TOTAL:
-        return False, f"Total sub count is {sum(subs)} but expected {MAX_SUBS_TOTAL}"
-    for stat in Stat:
-        if avg_sub_values[stat] != None:
-            min_subs = ALLOCATED_SUBS_PER_STAT
-            max_subs = ALLOCATED_SUBS_PER_STAT + DISTRIBUTED_STATS_PER_NON_STAT_MAIN * 5
-            for main in mains:
-                if stat == main:
-                    max_subs -= DISTRIBUTED_STATS_PER_NON_STAT_MAIN
 
-            if not (min_subs <= subs[stat] <= max_subs):
-                return False, f"'{stat}' has {subs[stat]} substats but expected {min_subs} to {max_subs} subs"
-    return True, ""
+def check_characters_standards(char_stats: dict[str, ArtifactStats], standards: Sequence[Rules],
+                               name="Unknown name") -> StandardsResult:
+    """Checks the characters against every standard, with one main stat enumeration per character"""
+    results = [ConfigResult(name, [], rules.name) for rules in standards]
+    for char, stats in char_stats.items():
+        for result, character in zip(results, check_character_standards(char, stats, standards)):
+            result.characters.append(character)
+    return StandardsResult(name, results)
 
 
-def debug(*args):
+def check_config_result(config: str, name="Unknown name", rules: Optional[Rules] = None) -> ConfigResult:
+    with phase("parse_config"):
+        char_stats = parse_config(config)
+    return check_characters(char_stats, name, rules)
+
+
+def check_json_result(jason: dict, name="Unknown name", rules: Optional[Rules] = None) -> ConfigResult:
+    with phase("parse_json"):
+        char_stats = parse_json(jason)
+    return check_characters(char_stats, name, rules)
+
+
+def check_config_standards(config: str, standards: Sequence[Rules], name="Unknown name") -> StandardsResult:
+    """check_config_result for several standards, parsing the config once"""
+    with phase("parse_config"):
+        char_stats = parse_config(config)
+    return check_characters_standards(char_stats, standards, name)
+
+
+def check_json_standards(jason: dict, standards: Sequence[Rules], name="Unknown name") -> StandardsResult:
+    """check_json_result for several standards, parsing the share once"""
+    with phase("parse_json"):
+        char_stats = parse_json(jason)
+    return check_characters_standards(char_stats, standards, name)
+
+
+def use_rules(rules: Rules):
+    """Makes rules the rules of every check that is not given others, e.g. after Stats.load_rules"""
+    global _rules
+    _rules = rules
+
+
+def verbosity() -> int:
+    """The verbosity selected by the DEBUG and PRINT_ONLY_FAILS flags"""
     if DEBUG:
-        print(*args)
+        return VERBOSITY_DEBUG
+    return VERBOSITY_FAILURES if PRINT_ONLY_FAILS else VERBOSITY_NORMAL
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument('filename', nargs='*', metavar='filename', type=str,
-                    default=[], help='the filename of the config to check')
-parser.add_argument('--glob', action='store', metavar='glob', type=str,
-                    default="", help='Directories of files')
-parser.add_argument('--debug', action='store_true',
-                    default=False, help='Print debug info')
-parser.add_argument('--print-only-failures', action='store_true',
-                    default=False, help='Prints results only on failures')
-parser.add_argument('--kurt', action='store_true', default=False,
-                    help='also check cons and weapon (not implemented yet)')
+def check_json(jason: dict, name="Unknown name"):
+    return check_json_result(jason, name).render(verbosity(), quote_name=False)
 
 
 def check_config(config: str, name="Unknown name"):
-    lines = preprocess_file(config)
-    char_stats = parse_lines(lines)
-    all_valid = True
-    msg = ""
-    for char in char_stats.keys():
-        possible_mains = 0
-        try:
-            possible_mains = guess_main_stats(char_stats[char])
-        except NotImplementedError:
-            debug(
-                f"{char} has 4* set. Skipping this character. Please confirm manually")
-            msg += f"\t{char} has 4* set. Skipping this character. Please confirm manually\n\n"
-            continue
-        if len(possible_mains) == 0:
-            debug(f"{char} does not have 5 possible main stats")
-            msg += f"\t{char} does not have 5 possible main stats\n\n"
-            all_valid = False
-            continue
-        debug(
-            f"For character {char} found possible main stats combinations: ")
-        err = ""
-        err_m = []
-        char_is_valid = False
-        for guess in possible_mains:
-            debug(f"\t{guess}")
-            err_m.append(f"\t\t{guess}\n")
-            if char_is_valid:
-                debug(
-                    "\t\tSkipping because a valid KQMC main/substat distribution has been found already")
-                continue
-            try:
-                subs = get_subs_from_guess(char_stats[char], guess)
-                debug(f"\t\t{subs=}")
-            except ValueError as e:
-                debug(
-                    f"\t\tThis main stat guess was invalid:\n {e}")
-                err_m[-1] += f"\t\t\t{e}"
-                continue
-            check, kqmc_msg = checkKQMC(guess, subs)
-            char_is_valid = char_is_valid or check
-            if not check:
-                debug(
-                    f"\t\tThis main stat guess was invalid due to failing KQMC substat check: {kqmc_msg}")
-                err_m = [err_m[-1] + f"\t\t\t{kqmc_msg}"]
-                break
-        if not char_is_valid:
-            debug(f"{char} isn't valid KQMC mains/substats")
-            msg += f"\t{char} isn't valid KQMC mains/substats\n"
-            if not DEBUG:
-                msg += err + '\n'.join(err_m) + "\n\n"
-        all_valid = all_valid and char_is_valid
-
-    if all_valid:
-        if not PRINT_ONLY_FAILS:
-            msg = f"'{name}' is KQMC valid\n" + msg
-        else:
-            msg = ""
-    else:
-        msg = f"'{name}' is not KQMC valid\n" + msg
+    return check_config_result(config, name).render(verbosity())
 
-    return msg
 
+def debug(*args):
+    if DEBUG:
+        print(*args)
 
-def main():
-    global DEBUG, PRINT_ONLY_FAILS
-    args = parser.parse_args()
-    DEBUG = args.debug
-    files = args.filename
-    PRINT_ONLY_FAILS = args.print_only_failures
 
-    glob_str = args.glob
-    if glob_str != "":
-        for file in glob.glob(glob_str, recursive=True):
-            print(f"Globbing found {file}")
-            files.append(file)
+def rules_version(standards: Optional[Sequence[Rules]] = None) -> str:
+    """Hash of every constant that affects a verdict, of CHECKER_VERSION and of the result layout, used to
+    invalidate cached results
+
+    Args:
+        standards: the rules of a check against several standards, RULES by default
+    """
+    import hashlib
+    from dataclasses import fields
+    rules = (
+        [[sorted(value) if isinstance(value, frozenset) else value
+          for value in (getattr(standard, f.name) for f in fields(Rules))]
+         for standard in (standards or (current_rules(),))],
+        EXACT,
+        CHECKER_VERSION,
+        [[f.name for f in fields(cls)]
+         for cls in (ConfigResult, CharacterResult, GuessResult, StandardsResult)],
+    )
+    return hashlib.sha256(repr(rules).encode()).hexdigest()
 
-    for f in files:
-        try:
-            file = open(f, 'r', encoding='UTF-8')
-            file_content = file.read()
-            msg = check_config(file_content, os.path.basename(file.name))
-            if msg:
-                print(msg)
-        except FileNotFoundError as e:
-            print(e, file=sys.stderr)
-        except Exception as e:
-            print(f"exception occured while processing {f}", file=sys.stderr)
-            print(e, file=sys.stderr)
-            traceback.print_exc()
-        finally:
-            file.close()
-
-
-main()
+
+if __name__ == "__main__":
+    import KQMCCli
+    sys.exit(KQMCCli.main())
@@ -1,29 +1,349 @@
-import requests
+import asyncio
+import io
 import json
-from discord import Client, Intents, Interaction, app_commands
-from discord.app_commands import AppCommandContext, AppInstallationType, CommandTree
+import multiprocessing
 import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+import aiohttp
+from discord import Attachment, Client, File, Intents, Interaction, Message, app_commands
+from discord.app_commands import AppCommandContext, AppInstallationType, CommandTree
+
+from JsonStream import read_character_details_async
+from KQMCChecker import ConfigResult, check_json_result, verbosity
+
+HTTP_TIMEOUT = float(os.getenv('KQMC_HTTP_TIMEOUT', '10'))
+MAX_CONCURRENT_FETCHES = int(os.getenv('KQMC_MAX_CONCURRENT_FETCHES', '8'))
+SHARE_CACHE_SIZE = int(os.getenv('KQMC_SHARE_CACHE_SIZE', '1024'))
+# db/ entries never change, sh/ links rarely do, invalid links may be fixed soon
+DB_CACHE_TTL = float(os.getenv('KQMC_DB_CACHE_TTL', str(7 * 24 * 3600)))
+SH_CACHE_TTL = float(os.getenv('KQMC_SH_CACHE_TTL', '3600'))
+NEGATIVE_CACHE_TTL = float(os.getenv('KQMC_NEGATIVE_CACHE_TTL', '60'))
+CHECK_WORKERS = int(os.getenv('KQMC_CHECK_WORKERS', '0')) or os.cpu_count() or 1
+# checks running at once, and checks allowed to wait for a free slot before new ones are turned away
+MAX_INFLIGHT_CHECKS = int(os.getenv('KQMC_MAX_INFLIGHT_CHECKS', '16'))
+MAX_QUEUED_CHECKS = int(os.getenv('KQMC_MAX_QUEUED_CHECKS', '64'))
+# links checked by one batch command, and the largest attachment read for links
+MAX_BATCH_LINKS = int(os.getenv('KQMC_MAX_BATCH_LINKS', '100'))
+MAX_ATTACHMENT_BYTES = int(os.getenv('KQMC_MAX_ATTACHMENT_BYTES', str(1 << 20)))
+# longest message Discord accepts
+MESSAGE_LIMIT = 2000
+
+LINK_PATTERN = re.compile(r"https://gcsim\.app/(?:sh|db)/[\w-]+")
+
+MISSING = object()
+# a link in a batch that could not be fetched, e.g. after a timeout or a server error, checking it again may work
+FAILED: Any = object()
+
+
+class TTLCache:
+    """LRU cache with a bounded size where every entry expires after its own time to live"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, ttl: float):
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# share id -> (character_details payload, ConfigResult), or None for invalid links
+share_cache = TTLCache(SHARE_CACHE_SIZE)
+
+
+def share_key(url: str) -> tuple[str, str]:
+    """Normalized share id of a gcsim viewer link, e.g. ("db", "BQMzFRgR98Tm")"""
+    kind = "db" if url.startswith("https://gcsim.app/db/") else "sh"
+    return kind, os.path.basename(url.rstrip("/"))
+
+
+class ShareFetcher:
+    """Fetches gcsim share payloads over a shared keep-alive session with bounded concurrency"""
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, max_concurrent: int = MAX_CONCURRENT_FETCHES):
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._max_concurrent = max_concurrent
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._max_concurrent, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self._timeout)
+            self._semaphore = asyncio.Semaphore(self._max_concurrent)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
-from KQMCChecker import check_json
+    async def get_character_details(self, url: str) -> Optional[list]:
+        """character_details of a share payload, the download stops as soon as it has been read"""
+        await self.start()
+        async with self._semaphore:
+            async with self._session.get(url) as r:
+                r.raise_for_status()
+                details = await read_character_details_async(r.content.iter_chunked(1 << 16))
+        return json.loads(details) if details is not None else None
 
 
-def get_json_from_url(url: str):
+fetcher = ShareFetcher()
+
+
+async def get_json_from_url(url: str):
+    """The part of a share payload that is checked, {"character_details": [...]}, or None when the share does not
+    exist or its payload cannot be read
+
+    Timeouts, connection errors and other HTTP errors are raised, they say nothing about the link.
+    """
+    if not url.startswith("https://gcsim.app/sh/") and not url.startswith("https://gcsim.app/db/"):
+        return None
+    name = os.path.basename(url)
+    new_url = "https://gcsim.app/api/share/"
+    new_url += ("db/" if url.startswith("https://gcsim.app/db/") else "")
+    new_url += name
     try:
-        if url.startswith("https://gcsim.app/sh/") or url.startswith("https://gcsim.app/db/"):
-            name = os.path.basename(url)
-            new_url = "https://gcsim.app/api/share/"
-            new_url += ("db/" if url.startswith("https://gcsim.app/db/") else "")
-            new_url += name
-            r = requests.get(new_url)
-            data: str = json.loads(r.text)
-            return data
+        details = await fetcher.get_character_details(new_url)
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
+            return None
+        raise
+    except ValueError as e:
+        # the payload is not JSON
+        print(f"{url}: {e!r}")
         return None
-    except Exception as e:
-        print(e)
+    return {"character_details": details} if details is not None else None
+
+
+class CheckLimiter:
+    """Bounds the number of checks in flight, queueing a limited number of extra checks"""
+
+    def __init__(self, max_inflight: int, max_queued: int):
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self._capacity = max_inflight + max_queued
+        self._admitted = 0
+
+    def full(self) -> bool:
+        return self._admitted >= self._capacity
+
+    def try_reserve(self, count: int) -> bool:
+        """Admits count checks at once, e.g. for a batch, False when the queue has no room for them
+
+        Reserved checks run in slots() and their room is given back with release.
+        """
+        if self._admitted + count > self._capacity:
+            return False
+        self._admitted += count
+        return True
+
+    def release(self, count: int):
+        self._admitted -= count
+
+    def slots(self) -> asyncio.Semaphore:
+        """The slots of the running checks, acquired by checks admitted with try_reserve"""
+        return self._semaphore
+
+    async def __aenter__(self):
+        self._admitted += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self._admitted -= 1
+            raise
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+        self._admitted -= 1
+
+
+limiter = CheckLimiter(MAX_INFLIGHT_CHECKS, MAX_QUEUED_CHECKS)
+# check_json_result is CPU bound, so it runs in worker processes to keep the event loop responsive.
+# spawn avoids forking the threads of a running client.
+check_executor: Optional[ProcessPoolExecutor] = None
+
+
+async def check_share(url: str, key: tuple[str, str]):
+    """Fetches and checks a share link, returning (payload, ConfigResult) or None when the link is invalid
+
+    Only invalid links are cached negatively, errors of get_json_from_url are raised and the link is fetched again
+    the next time.
+    """
+    data = await get_json_from_url(url)
+    if data is None or "character_details" not in data:
+        share_cache.put(key, None, NEGATIVE_CACHE_TTL)
         return None
+    payload = {"character_details": data["character_details"]}
+    loop = asyncio.get_running_loop()
+    checked = await loop.run_in_executor(check_executor, check_json_result, payload, url)
+    result = (payload, checked)
+    share_cache.put(key, result, DB_CACHE_TTL if key[0] == "db" else SH_CACHE_TTL)
+    return result
+
+
+def render(result: ConfigResult) -> str:
+    return result.render(verbosity(), quote_name=False)
+
+
+def fit_message(text: str) -> tuple[str, Optional[str]]:
+    """A reply that fits into a Discord message and the full text to attach, None when the reply holds all of it"""
+    if len(text) <= MESSAGE_LIMIT:
+        return text, None
+    note = "... see the attached report"
+    cut = text.rfind("\n", 0, MESSAGE_LIMIT - len(note) - 1)
+    if cut <= 0:
+        cut = MESSAGE_LIMIT - len(note) - 1
+    return text[:cut] + "\n" + note, text
+
+
+async def send_reply(send, reply: str, report: Optional[str]):
+    """Sends a reply, with the full report attached as a file when there is one"""
+    if report is None:
+        await send(reply)
+    else:
+        await send(reply, file=File(io.BytesIO(report.encode()), filename="kqmc-report.txt"))
+
+
+def find_links(text: str) -> list[str]:
+    """The gcsim viewer links in a text, every share once and in order of appearance"""
+    links = {}
+    for url in LINK_PATTERN.findall(text):
+        links.setdefault(share_key(url), url)
+    return list(links.values())
+
 
+async def check_links(urls: list[str], reserved: int) -> list[Optional[ConfigResult]]:
+    """The results of many share links, None for invalid links and FAILED for links that could not be checked
+
+    Links in the share cache are answered from it. The others are fetched and checked concurrently, at most
+    reserved at a time, in the slots of the check limiter that the caller reserved with limiter.try_reserve.
+    """
+    batch = asyncio.Semaphore(max(reserved, 1))
+
+    async def check(url: str):
+        key = share_key(url)
+        cached = share_cache.get(key)
+        if cached is MISSING:
+            async with batch, limiter.slots():
+                cached = await check_share(url, key)
+        return cached[1] if cached is not None else None
+
+    results = await asyncio.gather(*(check(url) for url in urls), return_exceptions=True)
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            print(f"{url}: {result!r}")
+    return [FAILED if isinstance(r, BaseException) else r for r in results]
+
+
+def _batch_detail(url: str, result: Optional[ConfigResult]) -> str:
+    if result is None:
+        return f"{url} was invalid\n"
+    if result is FAILED:
+        return f"{url} could not be checked\n"
+    return render(result)
+
+
+def batch_report(urls: list[str], results: list[Optional[ConfigResult]],
+                 skipped: int = 0) -> tuple[str, Optional[str]]:
+    """The reply to a batch of links and the full report to attach, None when the reply already holds all of it
+
+    The reply starts with the counts and lists the links that are not valid, up to the message limit.
+    """
+    checked = [r for r in results if r is not None and r is not FAILED]
+    valid = sum(r.valid for r in checked)
+    invalid = sum(r is None for r in results)
+    failed = sum(r is FAILED for r in results)
+    summary = f"Checked {len(urls)} links: {valid} KQMC valid, {len(checked) - valid} not KQMC valid"
+    if invalid:
+        summary += f", {invalid} invalid"
+    if failed:
+        summary += f", {failed} could not be checked, please try them again later"
+    if skipped:
+        summary += f". Only the first {len(urls)} links were checked, {skipped} more were left out"
+    failures = [(url, r) for url, r in zip(urls, results) if r is None or r is FAILED or not r.valid]
+    details = [_batch_detail(url, r) for url, r in failures]
+    report = summary + "\n\n" + "\n".join(details)
+    if len(report) <= MESSAGE_LIMIT:
+        return report.rstrip(), None
 
-client = Client(intents=Intents.default())
+    full = summary + "\n\n" + "\n".join(_batch_detail(url, r) for url, r in zip(urls, results))
+    lines = [summary, ""]
+    length = len(summary) + 1
+    for shown, (url, r) in enumerate(failures):
+        line = _batch_detail(url, r).rstrip() if r is None or r is FAILED else f"{url} is not KQMC valid"
+        # keep room for the line saying how many more there are
+        if length + len(line) + 1 > MESSAGE_LIMIT - 80:
+            lines.append(f"... and {len(failures) - shown} more, see the attached report")
+            break
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines), full
+
+
+async def reply_batch(interaction: Interaction, text: str):
+    """Checks every link in text and answers the deferred interaction with one message"""
+    urls = find_links(text)
+    if not urls:
+        await interaction.followup.send("Expected gcsim viewer links")
+        return
+    skipped = max(len(urls) - MAX_BATCH_LINKS, 0)
+    urls = urls[:MAX_BATCH_LINKS]
+    uncached = sum(share_cache.get(share_key(url)) is MISSING for url in urls)
+    # a batch takes up to MAX_INFLIGHT_CHECKS places in the queue and checks its links through them
+    reserved = min(uncached, MAX_INFLIGHT_CHECKS)
+    if not limiter.try_reserve(reserved):
+        await interaction.followup.send("Too many checks are running, please try again later")
+        return
+    try:
+        results = await check_links(urls, reserved)
+    finally:
+        limiter.release(reserved)
+    await send_reply(interaction.followup.send, *batch_report(urls, results, skipped))
+
+
+async def read_attachment(attachment: Attachment) -> str:
+    """The text of an attachment, empty when it is larger than MAX_ATTACHMENT_BYTES"""
+    if attachment.size > MAX_ATTACHMENT_BYTES:
+        return ""
+    return (await attachment.read()).decode("UTF-8", "replace")
+
+
+class KQMCClient(Client):
+    async def setup_hook(self):
+        global check_executor
+        await fetcher.start()
+        check_executor = ProcessPoolExecutor(
+            max_workers=CHECK_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    async def close(self):
+        await fetcher.close()
+        if check_executor is not None:
+            check_executor.shutdown(wait=False, cancel_futures=True)
+        await super().close()
+
+
+client = KQMCClient(intents=Intents.default())
 
 tree = CommandTree(client)
 
@@ -48,12 +368,61 @@ async def kqmc(interaction: Interaction, link: str):
         return
     if url[-1] == "/":
         url = url[:-1]
-    data = get_json_from_url(url)
-    if data is None:
-        await interaction.response.send_message("gcsim viewer link was invalid")
+    key = share_key(url)
+    cached = share_cache.get(key)
+    send = interaction.response.send_message
+    if cached is MISSING:
+        if limiter.full():
+            await interaction.response.send_message("Too many checks are running, please try again later")
+            return
+        # acknowledge right away, fetching and checking may take longer than Discord waits for a response
+        await interaction.response.defer(thinking=True)
+        send = interaction.followup.send
+        try:
+            async with limiter:
+                cached = await check_share(url, key)
+        except Exception as e:
+            # the interaction waits for a follow up, it must not be left thinking
+            print(f"{url}: {e!r}")
+            await send("The link could not be checked, please try again later")
+            return
+    if cached is None:
+        await send("gcsim viewer link was invalid")
+        return
+    _, result = cached
+    await send_reply(send, *fit_message(render(result)))
+
+
+@tree.command(name="kqmc-batch", description="Checks many gcsim share links at once and replies with one summary")
+async def kqmc_batch(interaction: Interaction, links: str = "", attachment: Optional[Attachment] = None):
+    """Checks every gcsim share link given, or listed in an attached text file
+    Args:
+        interaction (discord.Interaction): the interaction that invokes this coroutine
+        links (str): gcsim links to check, separated by spaces
+        attachment (discord.Attachment): text file with gcsim links to check
+    """
+    if attachment is not None and attachment.size > MAX_ATTACHMENT_BYTES:
+        await interaction.response.send_message(f"Attachments can be at most {MAX_ATTACHMENT_BYTES} bytes")
         return
-    msg = check_json(data, url)
-    await interaction.response.send_message(msg)
+    # acknowledge right away, fetching and checking many links takes longer than Discord waits for a response
+    await interaction.response.defer(thinking=True)
+    text = links
+    if attachment is not None:
+        text += "\n" + await read_attachment(attachment)
+    await reply_batch(interaction, text)
+
+
+@tree.context_menu(name="Check KQMC links")
+async def kqmc_message(interaction: Interaction, message: Message):
+    """Checks every gcsim share link in a message and its text attachments"""
+    await interaction.response.defer(thinking=True)
+    texts = [message.content]
+    for attachment in message.attachments:
+        if (attachment.content_type or "").startswith("text/") or attachment.filename.endswith(".txt"):
+            texts.append(await read_attachment(attachment))
+    await reply_batch(interaction, "\n".join(texts))
 
-TOKEN = os.getenv('DISCORD_TOKEN')
-client.run(TOKEN)
+# the check workers import this module, they must not start the bot
+if __name__ == "__main__":
+    TOKEN = os.getenv('DISCORD_TOKEN')
+    client.run(TOKEN)
@@ -0,0 +1,503 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from collections import deque
+from dataclasses import replace
+from functools import partial
+from itertools import chain
+from typing import Iterable, Optional, TextIO, Union
+
+import KQMCChecker as checker
+from BuildMemo import BuildMemo
+from JsonStream import read_character_details
+from KQMCChecker import ConfigResult, StandardsResult, check_config_result, check_config_standards, \
+    check_json_result, check_json_standards, phase, rules_version, verdict_changes
+from Profiling import Profiler
+
+# kept here so that plain config files do not import the archive modules
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+# the rules of every standard when more than one is checked in a pass, None to check checker.RULES only
+STANDARDS: Optional[list[checker.Rules]] = None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', nargs='*', metavar='filename', type=str,
+                        default=[], help='the filename of the config to check')
+    parser.add_argument('--glob', action='store', metavar='glob', type=str,
+                        default="", help='Directories of files')
+    parser.add_argument('--debug', action='store_true',
+                        default=False, help='Print debug info')
+    parser.add_argument('--print-only-failures', action='store_true',
+                        default=False, help='Prints results only on failures')
+    parser.add_argument('--kurt', action='store_true', default=False,
+                        help='also check KurtC (C6 4*, C0 5*, R3 weapons) in the same pass')
+    parser.add_argument('-j', '--jobs', action='store', metavar='N', type=int, nargs='?',
+                        default=1, const=0, help='check files in N processes (defaults to the CPU count when N is omitted)')
+    parser.add_argument('--unordered', action='store_true', default=False,
+                        help='with --jobs, print results as soon as they complete instead of in input order')
+    parser.add_argument('--stdin', action='store_true', default=False,
+                        help='read filenames to check from stdin, one per line')
+    parser.add_argument('-0', '--null', action='store_true', default=False,
+                        help='with --stdin, filenames are separated by NUL instead of newlines')
+    parser.add_argument('--stdin-configs', action='store_true', default=False,
+                        help='read config contents from stdin, multiple configs are separated by NUL characters')
+    parser.add_argument('--bundle', action='store_true', default=False,
+                        help='files are bundles of many configs separated by NUL characters')
+    parser.add_argument('--jsonl', action='store_true', default=False,
+                        help='print one JSON object per checked file instead of text')
+    parser.add_argument('--exact', action='store_true', default=False,
+                        help='require substats to be made of whole rolls at the real roll tiers instead of average rolls')
+    parser.add_argument('--rules', action='append', metavar='FILE', type=str, default=[],
+                        help='rules file to check against instead of rules/kqmc.json (or KQMC_RULES), '
+                             'repeat to check several standards in one pass')
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='print time spent per phase, counters and the slowest files and characters to stderr')
+    parser.add_argument('--profile-slowest', action='store', metavar='N', type=int, default=10,
+                        help='number of slowest files and characters listed by --profile')
+    parser.add_argument('--profile-out', action='store', metavar='file', type=str, default="",
+                        help='write cProfile stats of the main process to this file, e.g. for snakeviz or flameprof')
+    parser.add_argument('--watch', action='store_true', default=False,
+                        help='keep running and re-check files and globbed paths whenever they change')
+    parser.add_argument('--watch-interval', action='store', metavar='seconds', type=float, default=0.25,
+                        help='seconds between checks for changed files in --watch mode')
+    parser.add_argument('--cache', action='store_true', default=False,
+                        help='cache results by the content of the config, so unchanged configs are not checked again')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='do not use the result cache, even with --cache')
+    parser.add_argument('--clear-cache', action='store_true', default=False,
+                        help='remove all cached results before checking')
+    parser.add_argument('--cache-dir', action='store', metavar='dir', type=str, default="",
+                        help='directory of the result cache (defaults to ~/.cache/gcsim-kqmc-checker), '
+                             'implies --cache')
+    parser.add_argument('--cache-size', action='store', metavar='N', type=int, default=100_000,
+                        help='maximum number of cached results, least recently used results are evicted first')
+    parser.add_argument('--git-diff', action='store', metavar='base..head', type=str, default="",
+                        help='check only the configs added or modified between two git revisions, read from the '
+                             'object store. Filenames and --glob select the paths (defaults to *.txt)')
+    parser.add_argument('--verdict-changes', action='store_true', default=False,
+                        help='with --git-diff, also check the base revision and print the characters whose '
+                             'verdict changed')
+    parser.add_argument('--no-dedup', action='store_true', default=False,
+                        help='check every character build, even if the same build was checked in another file')
+    parser.add_argument('--dedup-file', action='store', metavar='file', type=str, default="",
+                        help='keep the checked character builds in this file for later runs')
+    return parser
+
+
+def is_result_json(name: str) -> bool:
+    """gcsim result JSON files are checked by their character_details instead of as configs"""
+    return name.lower().endswith(".json")
+
+
+def check_document(name: str, content: str) -> tuple[Optional[Union[ConfigResult, StandardsResult]], str]:
+    """Checks the contents of a single config, or of a gcsim result JSON when name ends with .json
+
+    Returns:
+        (result, err): the result, a StandardsResult when STANDARDS is set, or None and the error text when the
+        config could not be checked
+    """
+    try:
+        if not is_result_json(name):
+            if STANDARDS is not None:
+                return check_config_standards(content, STANDARDS, name), ""
+            return check_config_result(content, name), ""
+        jason = json.loads(content)
+        if not isinstance(jason, dict) or not isinstance(jason.get("character_details"), list):
+            return None, f"{name} has no character_details\n"
+        if STANDARDS is not None:
+            return check_json_standards(jason, STANDARDS, name), ""
+        return check_json_result(jason, name), ""
+    except Exception as e:
+        return None, f"exception occured while processing {name}\n{e}\n{traceback.format_exc()}"
+
+
+def read_file(f: str) -> str:
+    """The contents of a config file, or only the character_details of a result JSON file
+
+    Result files are read incrementally and reading stops after character_details, so the statistics and
+    logs of large result dumps are never loaded.
+    """
+    with phase("read"):
+        if not is_result_json(f):
+            with open(f, 'r', encoding='UTF-8') as file:
+                return file.read()
+        with open(f, 'rb') as file:
+            details = read_character_details(file)
+        if details is None:
+            return "{}"
+        return '{"character_details": ' + details.decode("UTF-8") + '}'
+
+
+def _read_source(f: str) -> tuple[Optional[str], str]:
+    """read_file, or None and the error text when the file cannot be read or is not UTF-8 text"""
+    try:
+        return read_file(f), ""
+    except OSError as e:
+        return None, f"{e}\n"
+    except ValueError as e:
+        # UnicodeDecodeError is a ValueError
+        return None, f"exception occured while processing {f}\n{e}\n{traceback.format_exc()}"
+
+
+def check_file(f: str) -> tuple[Optional[ConfigResult], str]:
+    """Checks a single config file, see check_document"""
+    file_content, err = _read_source(f)
+    if file_content is None:
+        return None, err
+    return check_document(os.path.basename(f), file_content)
+
+
+def _check_source(source: Union[str, tuple[str, str]]) -> tuple[Optional[ConfigResult], str]:
+    if isinstance(source, tuple):
+        return check_document(*source)
+    return check_file(source)
+
+
+def _profiled_check_source(source: Union[str, tuple[str, str]]) -> tuple[Optional[ConfigResult], str, Profiler]:
+    """_check_source with a fresh profiler, which is returned so results from worker processes can be merged"""
+    outer, profiler = checker.PROFILER, Profiler()
+    checker.PROFILER = profiler
+    try:
+        start = time.perf_counter()
+        result, err = _check_source(source)
+        name = _source_name(source)
+        profiler.files.append((time.perf_counter() - start, name))
+        profiler.characters = [(seconds, f"{name}: {char}")
+                               for seconds, char in profiler.characters]
+        profiler.count("files")
+        return result, err, profiler
+    finally:
+        checker.PROFILER = outer
+
+
+def _memo_check_source(check, source: Union[str, tuple[str, str]]) -> tuple:
+    """check in a worker process, followed by the profiler (or None) and the builds the worker solved
+
+    The builds are returned as arguments of BuildMemo.merge, so the main process can count and save them.
+    """
+    memo = checker.MEMO
+    hits, misses = memo.hits, memo.misses
+    outcome = check(source)
+    profiler = outcome[2] if len(outcome) == 3 else None
+    return outcome[0], outcome[1], profiler, (memo.take_added(), memo.hits - hits, memo.misses - misses)
+
+
+def _source_name(source: Union[str, tuple[str, str]]) -> str:
+    return source[0] if isinstance(source, tuple) else source
+
+
+def _init_worker(debug: bool, print_only_fails: bool, exact: bool, rules: checker.Rules,
+                 standards: Optional[list[checker.Rules]], memo_entries: Optional[dict]):
+    global STANDARDS
+    checker.DEBUG = debug
+    checker.PRINT_ONLY_FAILS = print_only_fails
+    checker.EXACT = exact
+    checker.use_rules(rules)
+    STANDARDS = standards
+    if memo_entries is not None:
+        checker.MEMO = BuildMemo(track_added=True)
+        checker.MEMO.entries.update(memo_entries)
+
+
+def _cached_sources(files: Iterable[Union[str, tuple[str, str]]], cache):
+    """Yields (name, source to check or None, cache key, finished result or None) for every input"""
+    for source in files:
+        name = _source_name(source)
+        if cache is None:
+            yield name, source, None, None
+            continue
+        if isinstance(source, tuple):
+            display_name, content = source
+        else:
+            display_name = os.path.basename(source)
+            content, err = _read_source(source)
+            if content is None:
+                yield name, None, None, (None, err)
+                continue
+        with phase("cache lookup"):
+            key = cache.key(content)
+            cached = cache.get(key)
+        if cached is not None:
+            yield name, None, None, (replace(cached, name=display_name), "")
+        else:
+            yield name, (display_name, content), key, None
+
+
+def check_files(files: Iterable[Union[str, tuple[str, str]]], jobs: int = 1, ordered: bool = True, cache=None):
+    """Yields (name, result, err) for every file or (name, content) pair, using a process pool when jobs != 1
+
+    With a ResultCache, configs whose content was checked before are answered from the cache without parsing.
+    With checker.MEMO set, worker processes start from its builds and the builds they solve are merged into it.
+    """
+    def finish(name, key, outcome):
+        if len(outcome) == 4:
+            checker.MEMO.merge(*outcome[3])
+        if len(outcome) > 2 and outcome[2] is not None:
+            checker.PROFILER.merge(outcome[2])
+        outcome = outcome[:2]
+        if key is not None and outcome[0] is not None:
+            cache.put(key, outcome[0])
+        return (name, *outcome)
+
+    check = _profiled_check_source if checker.PROFILER is not None else _check_source
+    sources = _cached_sources(files, cache)
+    if jobs == 1:
+        for name, source, key, done in sources:
+            yield finish(name, key, done if done is not None else check(source))
+        return
+
+    from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+    workers = jobs or os.cpu_count() or 1
+    # Only keep a bounded window of files in flight so that lazily produced inputs (e.g. from stdin)
+    # are checked and printed while they are still being read
+    window = workers * 4
+    memo_entries = checker.MEMO.entries if checker.MEMO is not None else None
+    if checker.MEMO is not None:
+        check = partial(_memo_check_source, check)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(checker.DEBUG, checker.PRINT_ONLY_FAILS, checker.EXACT,
+                                       checker.RULES, STANDARDS, memo_entries)) as executor:
+        pending = deque()
+        for name, source, key, done in sources:
+            if done is not None:
+                future = Future()
+                future.set_result(done)
+            else:
+                future = executor.submit(check, source)
+            pending.append((name, key, future))
+            while len(pending) >= window:
+                if ordered:
+                    name, key, future = pending.popleft()
+                    yield finish(name, key, future.result())
+                else:
+                    wait([item[2] for item in pending],
+                         return_when=FIRST_COMPLETED)
+                    for name, key, future in _pop_done(pending):
+                        yield finish(name, key, future.result())
+        if ordered:
+            for name, key, future in pending:
+                yield finish(name, key, future.result())
+        else:
+            while pending:
+                wait([item[2] for item in pending],
+                     return_when=FIRST_COMPLETED)
+                for name, key, future in _pop_done(pending):
+                    yield finish(name, key, future.result())
+
+
+def _pop_done(pending: deque):
+    done = [item for item in pending if item[2].done()]
+    for item in done:
+        pending.remove(item)
+    return done
+
+
+def format_result(name: str, result: Optional[Union[ConfigResult, StandardsResult]], err: str = "",
+                  jsonl: bool = False, changes: Optional[list[tuple[str, str, str, str]]] = None) -> str:
+    """The text printed for a checked file, or for a file that could not be checked when result is None
+
+    changes are the verdict changes of the file, see result_changes, and are printed after the result.
+    """
+    if jsonl:
+        if result is None:
+            error = err.strip().splitlines()[0] if err.strip() else "could not be checked"
+            return json.dumps({"name": os.path.basename(name), "valid": False, "error": error})
+        if result.valid and checker.PRINT_ONLY_FAILS:
+            return ""
+        out = result.to_dict()
+        if changes is not None:
+            out["verdict_changes"] = [{"standard": standard, "character": char, "base": old, "head": new}
+                                      for standard, char, old, new in changes]
+        return json.dumps(out)
+    out = result.render(checker.verbosity()) if result is not None else ""
+    if changes:
+        out += f"{name}: " + ", ".join(
+            (f"{char} ({standard})" if STANDARDS is not None else char)
+            + (" removed" if new == "removed" else f" {old} -> {new}")
+            for standard, char, old, new in changes) + "\n"
+    return out
+
+
+def result_changes(before: Optional[Union[ConfigResult, StandardsResult]],
+                   after: Optional[Union[ConfigResult, StandardsResult]]) -> list[tuple[str, str, str, str]]:
+    """(standard, character, verdict before, verdict after) of every character whose verdict changed between
+    two results of a file, see verdict_changes. A file missing before has only new characters."""
+    def by_standard(result) -> dict[str, ConfigResult]:
+        if result is None:
+            return {}
+        if isinstance(result, StandardsResult):
+            return {r.standard: r for r in result.standards}
+        return {result.standard: result}
+
+    before, after = by_standard(before), by_standard(after)
+    standards = list(after) + [standard for standard in before if standard not in after]
+    return [(standard, *change) for standard in standards
+            for change in verdict_changes(before.get(standard), after.get(standard))]
+
+
+def read_delimited(stream: TextIO, delimiter: str, chunk_size: int = 1 << 16):
+    """Lazily yields the non-empty items of a stream separated by delimiter"""
+    pending = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        *items, pending = (pending + chunk).split(delimiter)
+        yield from (item for item in items if item.strip())
+    if pending.strip():
+        yield pending
+
+
+def expand_archives(sources: Iterable[Union[str, tuple[str, str]]], bundle: bool, failed: list[str]):
+    """Replaces tar/zip archives, and every file when bundle is set, by the configs stored in them
+
+    Archives are read lazily one member at a time. Archives that cannot be read are appended to failed.
+    """
+    for source in sources:
+        if isinstance(source, tuple) or not (bundle or source.lower().endswith(ARCHIVE_SUFFIXES)):
+            yield source
+            continue
+        from KQMCArchive import ARCHIVE_ERRORS, documents
+        try:
+            yield from documents(source, bundle)
+        except ARCHIVE_ERRORS as e:
+            print(f"Could not read {source}: {e}", file=sys.stderr)
+            failed.append(source)
+
+
+def load_standards(paths: list[str], kurt: bool) -> list[checker.Rules]:
+    """The rules of every standard to check, checker.RULES when no rules files are given
+
+    Raises:
+        OSError, ValueError: when a rules file cannot be loaded
+    """
+    from Stats import KURTC_RULES_PATH, load_rules
+    standards = [load_rules(path) for path in paths] or [checker.RULES]
+    if kurt:
+        standards.append(load_rules(KURTC_RULES_PATH))
+    return standards
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    global STANDARDS
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.profile:
+        checker.PROFILER = Profiler()
+    cprofile = None
+    if args.profile_out:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    start = time.perf_counter()
+    checker.DEBUG = args.debug
+    checker.EXACT = args.exact
+    try:
+        standards = load_standards(args.rules, args.kurt)
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot load rules: {e}")
+    checker.use_rules(standards[0])
+    STANDARDS = standards if len(standards) > 1 else None
+    if STANDARDS is not None and args.watch:
+        parser.error("--watch checks one standard at a time")
+    files = args.filename
+    git_diff = None
+    if args.git_diff:
+        if args.watch or args.stdin or args.stdin_configs or args.bundle:
+            parser.error("--git-diff reads the configs from git, it cannot be combined with --watch, --stdin, "
+                         "--stdin-configs or --bundle")
+        from KQMCGit import DEFAULT_PATHSPECS, GitDiff, GitError
+        pathspecs = files + ([f":(glob){args.glob}"] if args.glob else [])
+        try:
+            git_diff = GitDiff.open(args.git_diff, pathspecs or DEFAULT_PATHSPECS)
+        except GitError as e:
+            parser.error(f"--git-diff {args.git_diff}: {e}")
+        files, args.glob = [], ""
+    elif args.verdict_changes:
+        parser.error("--verdict-changes needs --git-diff")
+    checker.PRINT_ONLY_FAILS = args.print_only_failures
+
+    if args.watch:
+        from KQMCWatch import Watcher
+        patterns = [args.glob] if args.glob else []
+        Watcher(files, patterns, args.watch_interval,
+                output=partial(print, flush=True)).run()
+        return 0
+
+    glob_str = args.glob
+    if glob_str != "":
+        for file in glob.glob(glob_str, recursive=True):
+            print(f"Globbing found {file}",
+                  file=sys.stderr if args.jsonl else sys.stdout)
+            files.append(file)
+
+    sources = files if git_diff is None else git_diff.documents(git_diff.head)
+    delimiter = "\0" if args.null else "\n"
+    if args.stdin:
+        sources = chain(files, (f.strip("\r\n") for f in read_delimited(sys.stdin, delimiter)))
+    elif args.stdin_configs:
+        docs = read_delimited(sys.stdin, "\0")
+        sources = chain(files, ((f"<stdin>:{i}", doc) for i, doc in enumerate(docs)))
+    failed_archives = []
+    sources = expand_archives(sources, args.bundle, failed_archives)
+
+    cache = None
+    use_cache = (args.cache or bool(args.cache_dir)) and not args.no_cache
+    if use_cache or args.clear_cache:
+        from ResultCache import ResultCache, default_cache_dir
+        cache = ResultCache(args.cache_dir or default_cache_dir(),
+                            rules_version(STANDARDS), args.cache_size)
+        if args.clear_cache:
+            cache.clear()
+        if not use_cache:
+            cache.close()
+            cache = None
+
+    if not args.no_dedup:
+        checker.MEMO = BuildMemo(args.dedup_file or None)
+
+    all_valid = True
+    try:
+        base_results = None
+        if args.verdict_changes:
+            base_results = {name: result for name, result, _ in
+                            check_files(git_diff.documents(git_diff.base), args.jobs, False, cache)}
+        for name, result, err in check_files(sources, args.jobs, not args.unordered, cache):
+            changes = None
+            if base_results is not None and result is not None:
+                changes = result_changes(base_results.get(name), result)
+            out = format_result(name, result, err, args.jsonl, changes)
+            if out:
+                print(out, flush=args.jsonl)
+            if err:
+                print(err, file=sys.stderr, end="")
+            all_valid = all_valid and result is not None and result.valid
+        all_valid = all_valid and not failed_archives
+    finally:
+        if cache is not None:
+            print(f"Result cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+            cache.close()
+        if checker.MEMO is not None:
+            if args.profile and checker.MEMO.lookups:
+                print(checker.MEMO.summary(), file=sys.stderr)
+            try:
+                checker.MEMO.save()
+            except OSError as e:
+                print(f"Could not save {args.dedup_file}: {e}", file=sys.stderr)
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_out)
+        if checker.PROFILER is not None:
+            print(f"Total wall time: {time.perf_counter() - start:.4f} s", file=sys.stderr)
+            print(checker.PROFILER.summary(args.profile_slowest), file=sys.stderr)
+
+    return 0 if all_valid else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
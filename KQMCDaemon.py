@@ -0,0 +1,364 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+from http import HTTPStatus
+from typing import Optional, Sequence
+
+from JsonStream import read_character_details
+
+DEFAULT_ADDRESS = os.getenv('KQMC_DAEMON_ADDRESS', '127.0.0.1:8765')
+RESULT_CACHE_SIZE = 10_000
+HERE = os.path.dirname(os.path.abspath(__file__))
+# the sources that decide a verdict, a daemon started before they changed checks differently than the client
+CHECKER_SOURCES = ("KQMCChecker.py", "Stats.py")
+
+
+class DaemonError(Exception):
+    """The daemon rejected a request, status is the HTTP status it answered"""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def _rules_digest(path: str) -> Optional[str]:
+    """sha256 of a rules file and the rules files it extends, None when one cannot be read"""
+    digest = hashlib.sha256()
+    seen = set()
+    while path not in seen:
+        seen.add(path)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        digest.update(data)
+        try:
+            extends = json.loads(data).get("extends")
+        except (ValueError, AttributeError):
+            break
+        if not extends:
+            break
+        path = os.path.join(os.path.dirname(path), extends)
+    return digest.hexdigest()
+
+
+def _digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def check_setup(rules: Sequence[str] = (), kurt: bool = False, exact: bool = False) -> dict:
+    """How --rules, --kurt and --exact set up the checker, as the client and the daemon compare it
+
+    Lists the rules files with their digests, --exact and the digests of CHECKER_SOURCES. It only reads files, so
+    the client does not import the checker or load the rules to ask the daemon.
+    """
+    # the files KQMCCli.load_standards loads, see Stats.default_rules and Stats.KURTC_RULES_PATH
+    paths = list(rules) or [os.environ.get("KQMC_RULES") or os.path.join(HERE, "rules", "kqmc.json")]
+    if kurt:
+        paths.append(os.path.join(HERE, "rules", "kurtc.json"))
+    paths = [os.path.abspath(path) for path in paths]
+    return {"rules": [[path, _rules_digest(path)] for path in paths], "exact": exact,
+            "checker": [_digest(os.path.join(HERE, name)) for name in CHECKER_SOURCES]}
+
+
+def configure(rules: Sequence[str] = (), kurt: bool = False, exact: bool = False):
+    """Sets up the checker like --rules, --kurt and --exact of KQMCChecker.py
+
+    Returns:
+        the rules of every standard when more than one is checked, None to check checker.RULES only
+
+    Raises:
+        OSError, ValueError: when a rules file cannot be loaded
+    """
+    import KQMCChecker as checker
+    from KQMCCli import load_standards
+    checker.EXACT = exact
+    standards = load_standards(list(rules), kurt)
+    checker.use_rules(standards[0])
+    return standards if len(standards) > 1 else None
+
+
+def _check(kind: str, payload, name: str, standards):
+    import KQMCChecker as checker
+    if kind == "config":
+        if standards is not None:
+            return checker.check_config_standards(payload, standards, name)
+        return checker.check_config_result(payload, name)
+    if standards is not None:
+        return checker.check_json_standards(payload, standards, name)
+    return checker.check_json_result(payload, name)
+
+
+def _failure(name: str, e: Exception) -> dict:
+    """The response for an input that could not be checked, like the --jsonl output of KQMCChecker.py"""
+    return {"name": name, "valid": False, "error": str(e) or type(e).__name__,
+            "text": f"exception occured while processing {name}\n{e}\n"}
+
+
+def serve(address: str = DEFAULT_ADDRESS, standards=None, setup: Optional[dict] = None):
+    """Runs the check daemon until interrupted, checking against checker.RULES or every rules of standards
+
+    POST /check takes {"configs": [{"name": ..., "text": ...}], "shares": [{"name": ..., "json": {...}}],
+    "verbosity": 0-2, "setup": ...} (or a single {"name": ..., "text": ...}) and returns {"results": [...]} with
+    the ConfigResult of every input as a dict plus its rendered "text", or {"name": ..., "valid": false, "error": ...}
+    for inputs that could not be checked. setup is the check_setup the daemon was started with, a request with
+    another one, because the client uses other rules or the rules or the checker changed since, is answered with
+    409. GET /health reports the rules version and the setup.
+    """
+    import threading
+    from collections import OrderedDict
+    from dataclasses import replace
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import KQMCChecker as checker
+
+    rules_version = checker.rules_version(standards)
+    setup = setup if setup is not None else check_setup()
+    results: OrderedDict[str, checker.ConfigResult] = OrderedDict()
+    lock = threading.Lock()
+    checker.main_stat_index()
+
+    def cached(kind: str, content: str, check):
+        key = hashlib.sha256(f"{kind}\0{content}".encode(
+            "UTF-8", "surrogatepass")).hexdigest()
+        with lock:
+            result = results.get(key)
+            if result is not None:
+                results.move_to_end(key)
+                return result
+        result = check()
+        with lock:
+            results[key] = result
+            while len(results) > RESULT_CACHE_SIZE:
+                results.popitem(last=False)
+        return result
+
+    def check_request(request: dict) -> list[dict]:
+        if "text" in request:
+            request = {"configs": [request]}
+        verbosity = request.get("verbosity", checker.VERBOSITY_NORMAL)
+        out = []
+        for config in request.get("configs", []):
+            name, text = config.get("name", "Unknown name"), config["text"]
+            try:
+                result = cached("config", text, lambda: _check("config", text, name, standards))
+            except Exception as e:
+                result = e
+            out.append((name, result, True))
+        for share in request.get("shares", []):
+            name, jason = share.get("name", "Unknown name"), share["json"]
+            content = json.dumps(jason.get("character_details"), sort_keys=True)
+            try:
+                result = cached("share", content, lambda: _check("share", jason, name, standards))
+            except Exception as e:
+                result = e
+            out.append((name, result, False))
+        response = []
+        for name, result, quote_name in out:
+            if isinstance(result, Exception):
+                response.append(_failure(name, result))
+                continue
+            if result.name != name:
+                result = replace(result, name=name)
+            response.append({**result.to_dict(), "text": result.render(verbosity, quote_name)})
+        return response
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"ok": True, "rules_version": rules_version, "setup": setup})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/check":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                if request.get("setup", setup) != setup:
+                    self._reply(HTTPStatus.CONFLICT, {
+                        "error": "the daemon checks with other rules or another checker version",
+                        "setup": setup})
+                    return
+                self._reply(200, {"results": check_request(request)})
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self._reply(400, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    host, port = address.rsplit(":", 1)
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    print(f"KQMC check daemon listening on http://{address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def request_daemon(request: dict, address: str = DEFAULT_ADDRESS, timeout: float = 30) -> Optional[list[dict]]:
+    """Sends a /check request to the daemon, returns None when no daemon is listening
+
+    Raises:
+        DaemonError: when the daemon rejects the request, with the error it answered
+    """
+    req = urllib.request.Request(f"http://{address}/check", data=json.dumps(request).encode(),
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return json.loads(r.read())["results"]
+    except urllib.error.HTTPError as e:
+        # an HTTPError is a URLError too, but it comes from a daemon that is listening
+        try:
+            error = json.loads(e.read())["error"]
+        except (ValueError, KeyError, TypeError):
+            error = e.reason
+        raise DaemonError(f"the daemon answered {e.code}: {error}", e.code) from e
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def check_in_process(request: dict, standards=None) -> list[dict]:
+    """The response of the daemon to a /check request, checked in this process"""
+    import KQMCChecker as checker
+    verbosity = request.get("verbosity", checker.VERBOSITY_NORMAL)
+    response = []
+    for config in request.get("configs", []):
+        try:
+            result = _check("config", config["text"], config["name"], standards)
+        except Exception as e:
+            response.append(_failure(config["name"], e))
+            continue
+        response.append({**result.to_dict(), "text": result.render(verbosity)})
+    for share in request.get("shares", []):
+        try:
+            result = _check("share", share["json"], share["name"], standards)
+        except Exception as e:
+            response.append(_failure(share["name"], e))
+            continue
+        response.append({**result.to_dict(), "text": result.render(verbosity, quote_name=False)})
+    return response
+
+
+def client(args: argparse.Namespace) -> int:
+    """Checks files through the daemon, or in this process when it is not running or checks with other rules
+
+    The checker is only imported and the rules only loaded when the files are checked in this process.
+    """
+    configs = []
+    shares = []
+    exit_code = 0
+    for f in args.filename:
+        try:
+            if f.lower().endswith(".json"):
+                with open(f, 'rb') as file:
+                    details = read_character_details(file)
+                if details is None:
+                    print(f"{f} has no character_details", file=sys.stderr)
+                    exit_code = 1
+                    continue
+                jason = {"character_details": json.loads(details)}
+                shares.append({"name": os.path.basename(f), "json": jason})
+            else:
+                with open(f, 'r', encoding='UTF-8') as file:
+                    configs.append({"name": os.path.basename(f), "text": file.read()})
+        except OSError as e:
+            print(e, file=sys.stderr)
+            exit_code = 1
+        except ValueError as e:
+            print(f"{f} is not valid JSON: {e}", file=sys.stderr)
+            exit_code = 1
+    verbosity = 2 if args.debug else 0 if args.print_only_failures else 1
+    request = {"configs": configs, "shares": shares, "verbosity": verbosity,
+               "setup": check_setup(args.rules, args.kurt, args.exact)}
+
+    try:
+        results = request_daemon(request, args.address) if not args.no_daemon else None
+    except DaemonError as e:
+        if e.status != HTTPStatus.CONFLICT:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"{e}, checking in this process", file=sys.stderr)
+        results = None
+    if results is None:
+        try:
+            standards = configure(args.rules, args.kurt, args.exact)
+        except (OSError, ValueError) as e:
+            print(f"cannot load rules: {e}", file=sys.stderr)
+            return 2
+        results = check_in_process(request, standards)
+    for result in results:
+        if args.jsonl:
+            if not (result["valid"] and args.print_only_failures):
+                print(json.dumps({k: v for k, v in result.items() if k != "text"}))
+        elif "error" in result:
+            print(result["text"], file=sys.stderr)
+        elif result["text"]:
+            print(result["text"])
+        if not result["valid"]:
+            exit_code = 1
+    return exit_code
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Long running KQMC check daemon and a client that falls back to checking in process")
+    parser.add_argument('--address', action='store', metavar='host:port', type=str, default=DEFAULT_ADDRESS,
+                        help='address of the daemon (defaults to KQMC_DAEMON_ADDRESS or 127.0.0.1:8765)')
+    # the daemon and the client must check against the same standards, so both take these
+    standards = argparse.ArgumentParser(add_help=False)
+    standards.add_argument('--exact', action='store_true', default=False,
+                           help='require substats to be made of whole rolls at the real roll tiers')
+    standards.add_argument('--kurt', action='store_true', default=False,
+                           help='also check KurtC (C6 4*, C0 5*, R3 weapons)')
+    standards.add_argument('--rules', action='append', metavar='FILE', type=str, default=[],
+                           help='rules file to check against instead of rules/kqmc.json (or KQMC_RULES), '
+                                'repeat to check several standards')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('serve', parents=[standards], help='run the daemon')
+    check = commands.add_parser(
+        'check', parents=[standards], help='check config files (or share .json files) through the daemon')
+    check.add_argument('filename', nargs='*', metavar='filename', type=str, default=[],
+                       help='the filename of the config to check')
+    check.add_argument('--debug', action='store_true', default=False, help='Print debug info')
+    check.add_argument('--print-only-failures', action='store_true', default=False,
+                       help='Prints results only on failures')
+    check.add_argument('--jsonl', action='store_true', default=False,
+                       help='print one JSON object per checked file instead of text')
+    check.add_argument('--no-daemon', action='store_true', default=False,
+                       help='always check in this process')
+    args = parser.parse_args(argv)
+    if args.command == 'check':
+        return client(args)
+    setup = check_setup(args.rules, args.kurt, args.exact)
+    try:
+        standards = configure(args.rules, args.kurt, args.exact)
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot load rules: {e}")
+    serve(args.address, standards, setup)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import io
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Iterator, Optional, Sequence
+
+from JsonStream import read_character_details
+from KQMCArchive import decode_document
+from KQMCChecker import phase
+
+# the files checked when no pathspecs are given
+DEFAULT_PATHSPECS = ("*.txt",)
+
+
+class GitError(Exception):
+    """A git command failed, e.g. because a revision does not exist"""
+
+
+def git(args: Sequence[str], repo: Optional[str] = None, error: str = "") -> bytes:
+    """The output of a git command run in repo, the current directory by default, error is the message of the
+    GitError raised when git fails without saying why
+
+    Raises:
+        GitError: when git cannot be run or fails
+    """
+    try:
+        done = subprocess.run(["git", *args], cwd=repo, capture_output=True)
+    except OSError as e:
+        raise GitError(f"cannot run git: {e}") from e
+    if done.returncode != 0:
+        raise GitError(done.stderr.decode("UTF-8", "replace").strip() or error or f"git {args[0]} failed")
+    return done.stdout
+
+
+def resolve(revision: str, repo: Optional[str] = None) -> str:
+    """The commit id of a revision"""
+    return git(["rev-parse", "--verify", "--quiet", "--end-of-options", f"{revision}^{{commit}}"],
+               repo, f"unknown revision {revision}").decode().strip()
+
+
+@dataclass
+class GitDiff:
+    """The config files added or modified between two commits
+
+    Args:
+        base (str): commit id of the base revision
+        head (str): commit id of the head revision
+        paths (list[str]): changed paths relative to the top of the repository
+        repo (str): directory in the repository, None for the current directory
+    """
+    base: str
+    head: str
+    paths: list[str]
+    repo: Optional[str] = None
+
+    @classmethod
+    def open(cls, revisions: str, pathspecs: Sequence[str] = DEFAULT_PATHSPECS,
+             repo: Optional[str] = None) -> "GitDiff":
+        """The changes in a revision range: "base..head", "base...head" to start from their merge base like a pull
+        request, or "base" for base..HEAD
+
+        Raises:
+            GitError: when a revision does not exist or the directory is not in a git repository
+        """
+        if "..." in revisions:
+            base, head = revisions.split("...", 1)
+            head = resolve(head or "HEAD", repo)
+            base = git(["merge-base", resolve(base or "HEAD", repo), head], repo).decode().strip()
+        else:
+            base, _, head = revisions.partition("..")
+            base, head = resolve(base or "HEAD", repo), resolve(head or "HEAD", repo)
+        with phase("git diff"):
+            out = git(["diff-tree", "-r", "-z", "--name-only", "--no-renames", "--diff-filter=d", base, head,
+                       "--", *pathspecs], repo)
+        paths = [p for p in out.decode("UTF-8", "surrogateescape").split("\0") if p]
+        return cls(base, head, paths, repo)
+
+    def documents(self, revision: str) -> Iterator[tuple[str, str]]:
+        """Yields (path, content) of every changed path that exists at revision, see read_blobs"""
+        paths = [p for p in self.paths if "\n" not in p]
+        for path in self.paths:
+            if "\n" in path:
+                print(f"Skipping {path!r}, git cat-file cannot read paths with newlines", file=sys.stderr)
+        for path, data in zip(paths, read_blobs([f"{revision}:{p}" for p in paths], self.repo)):
+            if data is None:
+                continue
+            if path.lower().endswith(".json"):
+                # only character_details is decoded, like read_file does for result files on disk
+                details = read_character_details(io.BytesIO(data))
+                if details is None:
+                    yield path, "{}"
+                    continue
+                data = b'{"character_details": ' + details + b'}'
+            content = decode_document(path, data)
+            if content is not None:
+                yield path, content
+
+
+def read_blobs(objects: Sequence[str], repo: Optional[str] = None) -> Iterator[Optional[bytes]]:
+    """Yields the content of every object, e.g. "<commit>:<path>", None for objects that are missing or not blobs
+
+    Every object is read from the object store by one git cat-file --batch process, so nothing is checked out.
+    The names are written from a thread, so contents are read while git is still being asked for more.
+    """
+    process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=repo, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE)
+
+    def ask():
+        try:
+            for name in objects:
+                process.stdin.write(name.encode("UTF-8", "surrogateescape") + b"\n")
+            process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    writer = threading.Thread(target=ask, daemon=True)
+    writer.start()
+    try:
+        for _ in objects:
+            with phase("read"):
+                data = _read_object(process.stdout)
+            yield data
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+        writer.join()
+
+
+def _read_object(stream) -> Optional[bytes]:
+    """Reads the next answer of git cat-file --batch, None when the object is missing or not a blob"""
+    header = stream.readline().rstrip(b"\n")
+    if not header:
+        raise GitError("git cat-file stopped early")
+    if header.endswith((b" missing", b" ambiguous")):
+        return None
+    _, kind, size = header.split()
+    data = stream.read(int(size) + 1)[:-1]
+    return data if kind == b"blob" else None
@@ -0,0 +1,132 @@
+import glob
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional
+
+import KQMCChecker as checker
+from KQMCChecker import ArtifactStats, CharacterResult, ConfigResult, check_character, parse_config, verdict_changes
+
+
+def character_key(char_stats: ArtifactStats) -> tuple:
+    """Identifies a character by everything its 'add stats', 'add set', 'add weapon' and 'char' lines contributed"""
+    return (tuple(char_stats.stats), tuple((s.name, s.count) for s in char_stats.sets),
+            char_stats.cons, char_stats.refine)
+
+
+@dataclass
+class WatchedFile:
+    signature: tuple = ()
+    digest: bytes = b""
+    result: Optional[ConfigResult] = None
+    characters: dict[tuple, CharacterResult] = field(default_factory=dict)
+
+
+class Watcher:
+    """Polls files for changes and re-checks only the files, and the characters in them, that changed
+
+    Args:
+        files (list[str]): files to watch
+        patterns (list[str]): globs that are expanded again every rescan seconds to pick up new files
+        interval (float): seconds between polls of the watched files
+        rescan (float): seconds between expanding the globs
+        output (Callable): called with every message
+    """
+
+    def __init__(self, files: list[str], patterns: list[str], interval: float = 0.25, rescan: float = 2.0,
+                 output: Callable[[str], None] = print):
+        self.files = list(files)
+        self.patterns = list(patterns)
+        self.interval = interval
+        self.rescan = rescan
+        self.output = output
+        self.watched: dict[str, WatchedFile] = {}
+        self._paths: list[str] = []
+        self._last_scan = float("-inf")
+
+    def paths(self) -> list[str]:
+        now = time.monotonic()
+        if now - self._last_scan >= self.rescan:
+            paths = dict.fromkeys(self.files)
+            for pattern in self.patterns:
+                paths.update(dict.fromkeys(glob.glob(pattern, recursive=True)))
+            self._paths = list(paths)
+            self._last_scan = now
+        return self._paths
+
+    def poll(self, initial: bool = False):
+        """Checks every file whose size or modification time changed since the last poll"""
+        paths = self.paths()
+        for path in [p for p in self.watched if p not in paths]:
+            del self.watched[path]
+            self.output(f"[{time.strftime('%H:%M:%S')}] {path} removed")
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                if path in self.watched:
+                    del self.watched[path]
+                    self.output(f"[{time.strftime('%H:%M:%S')}] {path} removed")
+                continue
+            signature = (st.st_mtime_ns, st.st_size)
+            watched = self.watched.get(path)
+            if watched is not None and watched.signature == signature:
+                continue
+            if watched is None:
+                watched = self.watched[path] = WatchedFile()
+            watched.signature = signature
+            self._check(path, watched, initial)
+
+    def _check(self, path: str, watched: WatchedFile, initial: bool):
+        try:
+            with open(path, 'r', encoding='UTF-8') as file:
+                content = file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            self.output(f"{e}")
+            return
+        digest = hashlib.blake2b(content.encode("UTF-8", "surrogatepass")).digest()
+        if digest == watched.digest:
+            return
+        watched.digest = digest
+
+        previous = watched.result
+        characters = {}
+        results = []
+        for char, char_stats in parse_config(content).items():
+            key = character_key(char_stats)
+            result = watched.characters.get(key)
+            if result is None:
+                result = check_character(char, char_stats)
+            elif result.name != char:
+                result = replace(result, name=char)
+            characters[key] = result
+            results.append(result)
+        watched.characters = characters
+        watched.result = ConfigResult(os.path.basename(path), results, checker.RULES.name)
+        self._report(path, previous, watched.result, initial)
+
+    def _report(self, path: str, previous: Optional[ConfigResult], current: ConfigResult, initial: bool):
+        if initial:
+            msg = current.render(checker.verbosity())
+            if msg:
+                self.output(msg)
+            return
+        changes = [f"{char} removed" if verdict == "removed" else f"{char} {old} -> {verdict}"
+                   for char, old, verdict in verdict_changes(previous, current)]
+        if not changes:
+            return
+        self.output(f"[{time.strftime('%H:%M:%S')}] {path}: " + ", ".join(changes))
+        msg = current.render(checker.verbosity())
+        if msg:
+            self.output(msg)
+
+    def run(self):
+        self.poll(initial=True)
+        self.output(f"Watching {len(self.watched)} files for changes, press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.poll()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,54 @@
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    """Collects wall and CPU time per phase, counters, and the time spent on every file and character"""
+
+    def __init__(self):
+        self.phases: dict[str, list[float]] = {}  # name -> [calls, wall, cpu]
+        self.counters: Counter = Counter()
+        self.files: list[tuple[float, str]] = []
+        self.characters: list[tuple[float, str]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            totals = self.phases.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += time.perf_counter() - wall
+            totals[2] += time.process_time() - cpu
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def merge(self, other: "Profiler"):
+        for name, (calls, wall, cpu) in other.phases.items():
+            totals = self.phases.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += calls
+            totals[1] += wall
+            totals[2] += cpu
+        self.counters.update(other.counters)
+        self.files += other.files
+        self.characters += other.characters
+
+    def summary(self, slowest: int = 10) -> str:
+        lines = ["Profile:", f"  {'phase':<20} {'calls':>9} {'wall s':>10} {'cpu s':>10}"]
+        for name, (calls, wall, cpu) in self.phases.items():
+            lines.append(f"  {name:<20} {calls:>9} {wall:>10.4f} {cpu:>10.4f}")
+        lines.append("Counters:")
+        for name, n in self.counters.items():
+            lines.append(f"  {name:<32} {n:>9}")
+        for title, timings in (("files", self.files), ("characters", self.characters)):
+            lines.append(f"Slowest {title}:")
+            for seconds, name in sorted(timings, reverse=True)[:slowest]:
+                lines.append(f"  {seconds * 1000:>10.3f} ms  {name}")
+        return "\n".join(lines)
+
+
+NO_PHASE = nullcontext()
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+from typing import Any, Optional
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "gcsim-kqmc-checker")
+
+
+class ResultCache:
+    """On-disk cache of check results keyed by a hash of the config content and the rules version
+
+    Entries are evicted least recently used first once there are more than max_entries.
+    """
+
+    COMMIT_EVERY = 256
+
+    def __init__(self, directory: str, version: str, max_entries: int = 100_000):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "results.sqlite3")
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self._conn = sqlite3.connect(self.path, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result BLOB NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def key(self, content: str) -> str:
+        h = hashlib.sha256(self.version.encode())
+        h.update(b"\0")
+        h.update(content.encode("UTF-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn.execute(
+            "SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            try:
+                result = pickle.loads(row[0])
+            except Exception:
+                # written by an incompatible version, treat it as a miss and overwrite it later
+                result = None
+            if result is not None:
+                self.hits += 1
+                self._conn.execute(
+                    "UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._count_write()
+                return result
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: Any):
+        self._conn.execute("INSERT OR REPLACE INTO results (key, result, last_used) VALUES (?, ?, ?)",
+                           (key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL), time.time()))
+        self._count_write()
+
+    def clear(self):
+        self._conn.execute("DELETE FROM results")
+        self._conn.commit()
+
+    def evict(self):
+        """Drops the least recently used entries beyond max_entries"""
+        self._conn.execute("DELETE FROM results WHERE key IN "
+                           "(SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def close(self):
+        self.evict()
+        self._conn.commit()
+        self._conn.close()
+
+    def _count_write(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_EVERY:
+            self._conn.commit()
+            self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
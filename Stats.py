@@ -1,4 +1,10 @@
+import marshal
+import os
+from array import array
+from dataclasses import dataclass, fields
 from enum import IntEnum
+from functools import lru_cache
+from typing import Optional
 
 
 class Stat(IntEnum):
@@ -36,76 +42,272 @@ class Stat(IntEnum):
         return self.name.replace("_pcnt", "%")
 
     def parse_stat(text: str):
-        if text in text_to_stat.keys():
-            return text_to_stat[text]
-        return Stat.nothing
-
-
-flower_stats = {Stat.hp}
-feather_stats = {Stat.atk}
-sands_stats = {Stat.er, Stat.em, Stat.atk_pcnt, Stat.defd_pcnt, Stat.hp_pcnt}
-hat_stats = {Stat.cr, Stat.cd, Stat.heal, Stat.em,
-             Stat.atk_pcnt, Stat.defd_pcnt, Stat.hp_pcnt}
-goblet_stats = {Stat.pyro, Stat.cryo, Stat.hydro, Stat.electro, Stat.geo,
-                Stat.anemo, Stat.physical, Stat.dendro, Stat.em, Stat.atk_pcnt, Stat.defd_pcnt, Stat.hp_pcnt}
-
-
-max_sub_values = [None for _ in Stat]
-max_sub_values[Stat.hp] = 298.75
-max_sub_values[Stat.hp_pcnt] = 0.0583
-max_sub_values[Stat.defd] = 23.15
-max_sub_values[Stat.defd_pcnt] = 0.0729
-max_sub_values[Stat.atk] = 19.45
-max_sub_values[Stat.atk_pcnt] = 0.0583
-max_sub_values[Stat.em] = 23.31
-max_sub_values[Stat.cr] = 0.0389
-max_sub_values[Stat.cd] = 0.0777
-max_sub_values[Stat.er] = 0.0648
-
-avg_sub_multiplier = 0.85
-avg_sub_values = [
-    sub*avg_sub_multiplier if sub is not None else None for sub in max_sub_values]
-avg_sub_values_4 = [
-    sub*0.8 if sub is not None else None for sub in avg_sub_values]
-
-main_values = [None for _ in Stat]
-main_values[Stat.hp] = 4780
-main_values[Stat.atk] = 311
-main_values[Stat.hp_pcnt] = 0.466
-main_values[Stat.atk_pcnt] = 0.466
-main_values[Stat.defd_pcnt] = 0.583
-main_values[Stat.em] = 186.5
-main_values[Stat.er] = 0.518
-main_values[Stat.pyro] = 0.466
-main_values[Stat.hydro] = 0.466
-main_values[Stat.cryo] = 0.466
-main_values[Stat.electro] = 0.466
-main_values[Stat.anemo] = 0.466
-main_values[Stat.geo] = 0.466
-main_values[Stat.dendro] = 0.466
-main_values[Stat.physical] = 0.583
-main_values[Stat.cr] = 0.311
-main_values[Stat.cd] = 0.622
-main_values[Stat.heal] = 0.359
-
-text_to_stat = {
-    "def%": Stat.defd_pcnt,
-    "def": Stat.defd,
-    "hp": Stat.hp,
-    "hp%": Stat.hp_pcnt,
-    "atk": Stat.atk,
-    "atk%": Stat.atk_pcnt,
-    "er": Stat.er,
-    "em": Stat.em,
-    "cr": Stat.cr,
-    "cd": Stat.cd,
-    "heal": Stat.heal,
-    "pyro%": Stat.pyro,
-    "hydro%": Stat.hydro,
-    "cryo%": Stat.cryo,
-    "electro%": Stat.electro,
-    "anemo%": Stat.anemo,
-    "geo%": Stat.geo,
-    "dendro%": Stat.dendro,
-    "phys%": Stat.physical,
-}
+        stat = default_rules().text_to_stat.get(text)
+        return Stat(stat) if stat is not None else Stat.nothing
+
+
+RULES_FORMAT = 1
+# version of compile_rules, bump it with every change to how rules files are compiled so that rules cached by an
+# older version are compiled again
+RULES_COMPILER_VERSION = 1
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules")
+DEFAULT_RULES_PATH = os.path.join(RULES_DIR, "kqmc.json")
+KURTC_RULES_PATH = os.path.join(RULES_DIR, "kurtc.json")
+SLOT_NAMES = ("flower", "feather", "sands", "hat", "goblet")
+
+
+@dataclass(eq=False)
+class Rules:
+    """A rules file compiled into flat tables indexed by Stat
+
+    Stats without a main or sub value have 0 in the arrays and are left out of main_stats/sub_stats, so the
+    checker loops over the stats that apply instead of testing for None.
+    """
+    name: str
+    version: str
+    max_stat_error: float
+    allocated_subs_per_stat: int
+    distributed_subs_per_non_stat_main: int
+    max_subs_total: int
+    avg_sub_multiplier: float
+    four_star_multiplier: float
+    # substat roll tiers in percent of the 5* max roll, 5* tiers followed by the 4* tiers
+    roll_tier_units: tuple[int, ...]
+    four_star_sets: frozenset[str]
+    text_to_stat: dict[str, int]
+    main_values: tuple[Optional[float], ...]
+    max_sub_values: tuple[Optional[float], ...]
+    # constellation and weapon refinement limits, None when the standard has none
+    max_cons_four_star: Optional[int]
+    max_cons_five_star: Optional[int]
+    max_refine: Optional[int]
+    five_star_characters: frozenset[str]
+    four_star_characters: frozenset[str]
+    # compiled tables
+    slot_masks: tuple[int, ...]  # bit s is set when Stat s can be the main stat of the slot, in SLOT_NAMES order
+    main_stats: tuple[int, ...]
+    sub_stats: tuple[int, ...]
+    main: array
+    main_tolerance: array  # how far a stat may be off a main value and still count as one
+    capacity_scale: array  # stat * capacity_scale is the number of main values the stat has room for
+    avg_sub: array
+    inv_avg_sub: array
+    roll_unit: array  # 1% of the max roll
+    max_subs: tuple[int, ...]  # the most subs a stat may have, by the number of slots with it as main stat
+
+    def slot_stats(self, slot: int) -> frozenset[Stat]:
+        return frozenset(stat for stat in Stat if self.slot_masks[slot] >> stat & 1)
+
+
+_ARRAY_FIELDS = ("main", "main_tolerance", "capacity_scale", "avg_sub", "inv_avg_sub", "roll_unit")
+
+
+def _stat(name: str, where: str) -> Stat:
+    if name not in Stat.__members__:
+        raise ValueError(f"Unknown stat {name!r} in {where}")
+    return Stat[name]
+
+
+def _stat_table(values: dict, where: str) -> list[Optional[float]]:
+    table: list[Optional[float]] = [None for _ in Stat]
+    for name, value in values.items():
+        table[_stat(name, where)] = float(value)
+    return table
+
+
+def compile_rules(data: dict) -> Rules:
+    """Compiles the contents of a rules file
+
+    Raises:
+        ValueError: when the rules are of another format, miss a value or name unknown stats
+    """
+    if not isinstance(data, dict) or data.get("format") != RULES_FORMAT:
+        raise ValueError(f"Unsupported rules format, expected format {RULES_FORMAT}")
+    try:
+        return _compile_rules(data)
+    except KeyError as e:
+        raise ValueError(f"Missing {e} in rules") from e
+
+
+def _compile_rules(data: dict) -> Rules:
+    error = float(data["max_stat_error"])
+    avg_multiplier = float(data["avg_sub_multiplier"])
+    four_star_multiplier = float(data["four_star_multiplier"])
+    allocated = int(data["allocated_subs_per_stat"])
+    distributed = int(data["distributed_subs_per_non_stat_main"])
+    main_values = _stat_table(data["main_values"], "main_values")
+    max_sub_values = _stat_table(data["max_sub_values"], "max_sub_values")
+    slot_masks = tuple(sum(1 << _stat(name, f"slots.{slot}") for name in set(data["slots"][slot]))
+                       for slot in SLOT_NAMES)
+    tiers = tuple(int(t) for t in data["roll_tiers"])
+    limits = data.get("limits", {})
+
+    def limit(name: str) -> Optional[int]:
+        return int(limits[name]) if limits.get(name) is not None else None
+
+    def flat(values) -> array:
+        return array("d", [v if v is not None else 0.0 for v in values])
+
+    avg_sub = [v * avg_multiplier if v is not None else None for v in max_sub_values]
+    return Rules(
+        name=str(data["name"]),
+        version=str(data["version"]),
+        max_stat_error=error,
+        allocated_subs_per_stat=allocated,
+        distributed_subs_per_non_stat_main=distributed,
+        max_subs_total=int(data["max_subs_total"]),
+        avg_sub_multiplier=avg_multiplier,
+        four_star_multiplier=four_star_multiplier,
+        roll_tier_units=tiers + tuple(round(t * four_star_multiplier) for t in tiers),
+        four_star_sets=frozenset(data["four_star_sets"]),
+        text_to_stat={text: int(_stat(name, "stat_text")) for text, name in data["stat_text"].items()},
+        main_values=tuple(main_values),
+        max_sub_values=tuple(max_sub_values),
+        max_cons_four_star=limit("four_star_constellation"),
+        max_cons_five_star=limit("five_star_constellation"),
+        max_refine=limit("weapon_refinement"),
+        five_star_characters=frozenset(name.lower() for name in data.get("five_star_characters", ())),
+        four_star_characters=frozenset(name.lower() for name in data.get("four_star_characters", ())),
+        slot_masks=slot_masks,
+        main_stats=tuple(stat for stat in range(len(Stat)) if main_values[stat] is not None),
+        sub_stats=tuple(stat for stat in range(len(Stat)) if max_sub_values[stat] is not None),
+        main=flat(main_values),
+        main_tolerance=flat(v * error if v is not None else None for v in main_values),
+        capacity_scale=flat((1 + error) / v if v else None for v in main_values),
+        avg_sub=flat(avg_sub),
+        inv_avg_sub=flat(1 / v if v else None for v in avg_sub),
+        roll_unit=flat(v / 100 if v is not None else None for v in max_sub_values),
+        max_subs=tuple(allocated + distributed * (5 - mains) for mains in range(6)),
+    )
+
+
+def _cache_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, "__pycache__", f"{name}.{RULES_FORMAT}.marshal")
+
+
+def _signature(path: str) -> tuple[str, int, int]:
+    st = os.stat(path)
+    return path, st.st_mtime_ns, st.st_size
+
+
+def _dump_rules(rules: Rules) -> tuple:
+    return tuple(getattr(rules, f.name).tobytes() if f.name in _ARRAY_FIELDS else getattr(rules, f.name)
+                 for f in fields(Rules))
+
+
+def _load_rules(values: tuple) -> Rules:
+    values = dict(zip((f.name for f in fields(Rules)), values))
+    for name in _ARRAY_FIELDS:
+        values[name] = array("d", values[name])
+    return Rules(**values)
+
+
+def _cached_rules(path: str) -> Optional[Rules]:
+    try:
+        with open(_cache_path(path), "rb") as file:
+            compiler, names, signatures, values = marshal.loads(file.read())
+        if compiler != RULES_COMPILER_VERSION or names != tuple(f.name for f in fields(Rules)):
+            return None
+        if any(_signature(dependency) != (dependency, mtime, size) for dependency, mtime, size in signatures):
+            return None
+        return _load_rules(values)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def read_rules(path: str, files: Optional[list[str]] = None) -> dict:
+    """The contents of a rules file, merged over the rules file it extends
+
+    A rules file with "extends": "other.json" only lists what differs from other.json, which is looked up next to
+    it. The paths of every file read are appended to files.
+    """
+    import json
+    files = files if files is not None else []
+    path = os.path.abspath(path)
+    if path in files:
+        raise ValueError(f"{path} extends itself")
+    files.append(path)
+    with open(path, "rb") as file:
+        data = json.loads(file.read())
+    if not isinstance(data, dict) or "extends" not in data:
+        return data
+    base = read_rules(os.path.join(os.path.dirname(path), data["extends"]), files)
+    merged = {**base, **data}
+    del merged["extends"]
+    return merged
+
+
+def load_rules(path: str = DEFAULT_RULES_PATH, cache: bool = True) -> Rules:
+    """Loads and compiles a rules file
+
+    The compiled tables are cached in __pycache__ next to the rules file, like the bytecode of a module, and
+    are used as long as the rules file and the files it extends keep their modification time and size, Rules
+    its fields and RULES_COMPILER_VERSION its value. That skips parsing the JSON and the json import on start up.
+
+    Raises:
+        OSError: when a rules file cannot be read
+        ValueError: when a rules file is not valid
+    """
+    path = os.path.abspath(path)
+    if cache:
+        rules = _cached_rules(path)
+        if rules is not None:
+            return rules
+    files: list[str] = []
+    rules = compile_rules(read_rules(path, files))
+    if cache:
+        cache_path = _cache_path(path)
+        try:
+            data = marshal.dumps((RULES_COMPILER_VERSION, tuple(f.name for f in fields(Rules)),
+                                  tuple(map(_signature, files)), _dump_rules(rules)))
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as file:
+                file.write(data)
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass
+    return rules
+
+
+_default_rules: Optional[Rules] = None
+
+
+def default_rules() -> Rules:
+    """The rules in effect when nothing else is asked for, also available as RULES
+
+    KQMC_RULES points to another rules file. They are loaded on first use, so importing this module reads and
+    writes no files.
+    """
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = load_rules(os.environ.get("KQMC_RULES") or DEFAULT_RULES_PATH)
+    return _default_rules
+
+
+_OLD_TABLE_NAMES = ("flower_stats", "feather_stats", "sands_stats", "hat_stats", "goblet_stats", "max_sub_values",
+                    "avg_sub_multiplier", "avg_sub_values", "avg_sub_values_4", "main_values", "text_to_stat")
+
+
+@lru_cache(maxsize=None)
+def _old_tables(rules: Rules) -> dict:
+    """The tables of rules under their old names"""
+    tables = dict(zip(_OLD_TABLE_NAMES[:5], (set(rules.slot_stats(slot)) for slot in range(len(SLOT_NAMES)))))
+    tables["max_sub_values"] = list(rules.max_sub_values)
+    tables["avg_sub_multiplier"] = rules.avg_sub_multiplier
+    tables["avg_sub_values"] = [
+        sub*rules.avg_sub_multiplier if sub is not None else None for sub in rules.max_sub_values]
+    tables["avg_sub_values_4"] = [
+        sub*rules.four_star_multiplier if sub is not None else None for sub in tables["avg_sub_values"]]
+    tables["main_values"] = list(rules.main_values)
+    tables["text_to_stat"] = {text: Stat(stat) for text, stat in rules.text_to_stat.items()}
+    return tables
+
+
+def __getattr__(name: str):
+    if name == "RULES":
+        return default_rules()
+    if name in _OLD_TABLE_NAMES:
+        return _old_tables(default_rules())[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,46 @@
+"""Microbenchmark for guess_main_stats: per-character enumeration vs the precomputed index.
+
+Run from the repository root: python benchmarks/bench_guess_main_stats.py
+"""
+import os
+import sys
+import timeit
+from itertools import product
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from KQMCChecker import ArtifactStats, check_main_stats_possible, guess_main_stats, MAX_STAT_ERROR  # noqa: E402
+from Stats import Stat, main_values, flower_stats, feather_stats, sands_stats, hat_stats, goblet_stats  # noqa: E402
+
+
+def guess_main_stats_enumerate(char_stats: ArtifactStats):
+    """The old implementation, rebuilding product() for every character"""
+    possible_main_stats = [0 for _ in Stat]
+    for stat in Stat:
+        if main_values[stat] is not None and char_stats.stats[stat] * (1+MAX_STAT_ERROR) >= main_values[stat]:
+            possible_main_stats[stat] = int(
+                char_stats.stats[stat] * (1+MAX_STAT_ERROR) / main_values[stat])
+    perms = product(flower_stats, feather_stats,
+                    sands_stats, hat_stats, goblet_stats)
+    return [p for p in perms if check_main_stats_possible(p, possible_main_stats)]
+
+
+def make_char() -> ArtifactStats:
+    char = ArtifactStats()
+    for stat, value in [(Stat.hp, 5287.88), (Stat.atk, 344.08), (Stat.er, 0.6282), (Stat.pyro, 0.466),
+                        (Stat.cr, 0.642), (Stat.cd, 0.7944), (Stat.atk_pcnt, 0.1984), (Stat.hp_pcnt, 0.0992),
+                        (Stat.defd_pcnt, 0.124), (Stat.defd, 39.36), (Stat.em, 39.64)]:
+        char.stats[stat] = value
+    return char
+
+
+def main():
+    char = make_char()
+    assert guess_main_stats(char) == guess_main_stats_enumerate(char)
+    number = 2000
+    for name, func in [("enumerate", guess_main_stats_enumerate), ("indexed", guess_main_stats)]:
+        best = min(timeit.repeat(lambda: func(char), number=number, repeat=5))
+        print(f"{name:>10}: {best / number * 1e6:8.2f} us/character")
+
+
+if __name__ == "__main__":
+    main()
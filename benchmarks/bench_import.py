@@ -0,0 +1,55 @@
+"""Measures the cold start cost of importing the checker library and of running the CLI
+
+Each measurement starts a fresh interpreter, and the interpreter startup alone is subtracted.
+Run from the repository root: python benchmarks/bench_import.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CASES = [
+    ("import KQMCChecker", ["-c", "import KQMCChecker"]),
+    ("import KQMCCli", ["-c", "import KQMCCli"]),
+    ("KQMCChecker.py --help", ["KQMCChecker.py", "--help"]),
+]
+
+
+def run(args: list[str], runs: int) -> float:
+    """Median wall time in seconds of running the interpreter with args"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT,
+                       stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of module in seconds as reported by -X importtime"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                         stderr=subprocess.PIPE, text=True, check=True).stderr
+    for line in out.splitlines():
+        fields = [f.strip() for f in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    return float("nan")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    # warm up the bytecode cache so only the import itself is measured
+    run(["-c", "import KQMCCli"], 1)
+    baseline = run(["-c", "pass"], runs)
+    print(f"{'interpreter startup':>24}: {baseline * 1000:7.2f} ms")
+    for name, args in CASES:
+        print(f"{name:>24}: {(run(args, runs) - baseline) * 1000:7.2f} ms over startup")
+    for module in ("KQMCChecker", "KQMCCli"):
+        print(f"{module + ' -X importtime':>24}: {import_time(module) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Measures the memory held per parsed character when a whole corpus is loaded with parse_config
+
+Run from the repository root: python benchmarks/bench_memory.py
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from KQMCChecker import parse_config, parse_json  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def retained_bytes(func, items) -> tuple[int, int]:
+    """Bytes still allocated after func ran over every item, and the number of characters it returned"""
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    parsed = [func(item) for item in items]
+    gc.collect()
+    end = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    characters = sum(len(p) for p in parsed)
+    # the dicts holding the characters are not part of the representation
+    dicts = sum(sys.getsizeof(p) for p in parsed) + sys.getsizeof(parsed)
+    return end - start - dicts, characters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--characters', metavar='N', type=int, default=20_000)
+    parser.add_argument('--seed', metavar='N', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    configs = synthetic.corpus(rng, args.characters)
+    payloads = [synthetic.share_json(rng, padding=0) for _ in range(args.characters // 4)]
+    for name, func, items in (("parse_config", parse_config, configs), ("parse_json", parse_json, payloads)):
+        size, characters = retained_bytes(func, items)
+        print(f"{name:>12}: {size / characters:8.1f} bytes per character over {characters} characters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Times every stage of the checker on synthetic configs and writes the results as JSON
+
+Run from the repository root: python benchmarks/run_benchmarks.py --output bench_results.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import KQMCChecker  # noqa: E402
+from KQMCChecker import preprocess_file, parse_lines, parse_config, parse_json, guess_main_stats, \
+    get_subs_from_guess, checkKQMC, check_config  # noqa: E402
+from JsonStream import read_character_details  # noqa: E402
+import synthetic  # noqa: E402
+
+DEFAULT_SIZES = [1, 10, 100, 1_000, 10_000, 100_000]
+
+
+def timed(func, items, repeat: int) -> dict:
+    """Best of repeat runs of func over all items"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(*item)
+        best = min(best, time.perf_counter() - start)
+    return {
+        "items": len(items),
+        "seconds": best,
+        "per_item_us": best / max(len(items), 1) * 1e6,
+        "items_per_s": len(items) / best if best > 0 else None,
+    }
+
+
+def _guess_main_stats(char_stats):
+    try:
+        return guess_main_stats(char_stats)
+    except NotImplementedError:
+        return []
+
+
+def _get_subs_from_guess(char_stats, guess):
+    try:
+        return get_subs_from_guess(char_stats, guess)
+    except ValueError:
+        return None
+
+
+def stage_benchmarks(rng: random.Random, characters: int, repeat: int) -> dict:
+    configs = synthetic.corpus(rng, characters)
+    payloads = [synthetic.share_json(rng) for _ in configs]
+    encoded = [json.dumps(p).encode() for p in payloads]
+    lines = [preprocess_file(c) for c in configs]
+    chars = [stats for c in configs for stats in parse_config(c).values()]
+    guesses = [(stats, guess) for stats in chars for guess in _guess_main_stats(stats)]
+    subs = [(guess, s) for stats, guess in guesses
+            if (s := _get_subs_from_guess(stats, guess)) is not None]
+
+    return {
+        "preprocess_file": timed(preprocess_file, [(c,) for c in configs], repeat),
+        "parse_lines": timed(parse_lines, [(ls,) for ls in lines], repeat),
+        "parse_config": timed(parse_config, [(c,) for c in configs], repeat),
+        "parse_json": timed(parse_json, [(p,) for p in payloads], repeat),
+        "json.loads": timed(json.loads, [(e,) for e in encoded], repeat),
+        "read_character_details": timed(lambda e: read_character_details(io.BytesIO(e)),
+                                        [(e,) for e in encoded], repeat),
+        "guess_main_stats": timed(_guess_main_stats, [(c,) for c in chars], repeat),
+        "get_subs_from_guess": timed(_get_subs_from_guess, guesses, repeat),
+        "checkKQMC": timed(checkKQMC, subs, repeat),
+    }
+
+
+def end_to_end_benchmarks(rng: random.Random, sizes: list[int], repeat: int) -> list[dict]:
+    results = []
+    for size in sizes:
+        configs = synthetic.corpus(rng, size)
+        result = timed(check_config, [(c,) for c in configs], repeat if size < 10_000 else 1)
+        results.append({
+            "characters": size,
+            "configs": len(configs),
+            "seconds": result["seconds"],
+            "characters_per_s": size / result["seconds"] if result["seconds"] > 0 else None,
+        })
+        print(f"check_config {size:>7} characters: {result['seconds']:.3f} s", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output', metavar='file', type=str, default="",
+                        help='write the results as JSON to this file instead of stdout')
+    parser.add_argument('--sizes', metavar='N', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='corpus sizes in characters for the end-to-end check_config benchmark')
+    parser.add_argument('--stage-characters', metavar='N', type=int, default=2_000,
+                        help='number of characters used for the per-stage benchmarks')
+    parser.add_argument('--repeat', metavar='N', type=int, default=3,
+                        help='runs per benchmark, the fastest is reported')
+    parser.add_argument('--seed', metavar='N', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "seed": args.seed,
+        "exact": KQMCChecker.EXACT,
+        "stages": stage_benchmarks(rng, args.stage_characters, args.repeat),
+        "end_to_end": end_to_end_benchmarks(rng, args.sizes, args.repeat),
+    }
+    for name, stage in results["stages"].items():
+        print(f"{name:>20}: {stage['per_item_us']:9.2f} us/item over {stage['items']} items",
+              file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Generates synthetic gcsim configs and share JSON payloads for benchmarks
+
+Characters get a random main stat combination and a substat distribution built from the real
+main_values and avg_sub_values. Valid characters follow the KQMC limits, invalid ones break them
+with a partial sub, a sub too many or a stat over its limit.
+"""
+import os
+import random
+import sys
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from KQMCChecker import MAIN_STAT_COMBINATIONS, ALLOCATED_SUBS_PER_STAT, DISTRIBUTED_STATS_PER_NON_STAT_MAIN, \
+    MAX_SUBS_TOTAL, four_star_arti_sets  # noqa: E402
+from Stats import Stat, main_values, avg_sub_values, text_to_stat  # noqa: E402
+
+CHARACTERS = ["raidenshogun", "xiangling", "xingqiu", "bennett", "hutao", "yelan", "nahida", "furina",
+              "kazuha", "zhongli", "ayaka", "shenhe", "alhaitham", "neuvillette", "fischl", "beidou"]
+FIVE_STAR_SETS = ["emblemofseveredfate", "crimsonwitchofflames", "noblesseoblige", "viridescentvenerer",
+                  "gildeddreams", "deepwoodmemories", "heartofdepth", "tenacityofthemillelith"]
+FOUR_STAR_SETS = sorted(four_star_arti_sets)
+SUB_STATS = [stat for stat in Stat if avg_sub_values[stat] is not None]
+STAT_TO_TEXT = {stat: text for text, stat in text_to_stat.items()}
+
+
+def valid_subs(rng: random.Random, mains: tuple) -> list[int]:
+    """A substat count per stat that satisfies the KQMC limits for the given main stats"""
+    subs = [0 for _ in Stat]
+    room = {}
+    for stat in SUB_STATS:
+        subs[stat] = ALLOCATED_SUBS_PER_STAT
+        room[stat] = DISTRIBUTED_STATS_PER_NON_STAT_MAIN * \
+            (5 - mains.count(stat))
+    for _ in range(MAX_SUBS_TOTAL - ALLOCATED_SUBS_PER_STAT * len(SUB_STATS)):
+        stat = rng.choice([s for s in SUB_STATS if room[s] > 0])
+        subs[stat] += 1
+        room[stat] -= 1
+    return subs
+
+
+def character_stats(rng: random.Random, valid: bool = True) -> tuple[tuple, list[float]]:
+    """Main stats and the summed stats vector of a character"""
+    mains = rng.choice(MAIN_STAT_COMBINATIONS)
+    subs = [float(n) for n in valid_subs(rng, mains)]
+    if not valid:
+        kind = rng.randrange(3)
+        stat = rng.choice(SUB_STATS)
+        if kind == 0:
+            subs[stat] += 0.5
+        elif kind == 1:
+            subs[stat] += 1
+        else:
+            subs[stat] = ALLOCATED_SUBS_PER_STAT + \
+                DISTRIBUTED_STATS_PER_NON_STAT_MAIN * 5 + 1
+    stats = [0.0 for _ in Stat]
+    for stat in mains:
+        stats[stat] += main_values[stat]
+    for stat in SUB_STATS:
+        stats[stat] += subs[stat] * avg_sub_values[stat]
+    return mains, stats
+
+
+def _stats_text(stats: dict[Stat, float]) -> str:
+    return " ".join(f"{STAT_TO_TEXT[stat]}={round(value, 6)}" for stat, value in stats.items())
+
+
+def character_lines(rng: random.Random, name: str, valid: bool = True, four_star: bool = False) -> list[str]:
+    mains, stats = character_stats(rng, valid)
+    set_name = rng.choice(FOUR_STAR_SETS if four_star else FIVE_STAR_SETS)
+    main_stats = {}
+    for stat in mains:
+        main_stats[stat] = main_stats.get(stat, 0) + main_values[stat]
+    sub_stats = {stat: stats[stat] - main_stats.get(stat, 0)
+                 for stat in SUB_STATS}
+    return [
+        f"{name} char lvl=90/90 cons=0 talent=9,9,9;",
+        f'{name} add weapon="favoniuslance" refine=3 lvl=90/90;',
+        f'{name} add set="{set_name}" count=4;',
+        f"{name} add stats {_stats_text(main_stats)}; # main",
+        f"{name} add stats {_stats_text(sub_stats)};",
+        "",
+    ]
+
+
+def config(rng: random.Random, characters: int = 4, invalid_rate: float = 0.2, four_star_rate: float = 0.05) -> str:
+    """A gcsim config with the given number of characters, comments, options and a rotation"""
+    lines = ["# synthetic config generated for benchmarks",
+             "options iteration=1000 duration=90 swap_delay=12;", ""]
+    names = _names(rng, characters)
+    for name in names:
+        lines += character_lines(rng, name, rng.random() >= invalid_rate,
+                                 rng.random() < four_star_rate)
+    lines += ['target lvl=100 resist=0.1 radius=2 pos=2.4,0 hp=999999999;',
+              "energy every interval=480,720 amount=1;", "",
+              "while 1 {"]
+    lines += [f"  {name} skill, burst, attack:3; # rotation" for name in names]
+    lines += ["}", ""]
+    return "\n".join(lines)
+
+
+def share_json(rng: random.Random, characters: int = 4, invalid_rate: float = 0.2, four_star_rate: float = 0.05,
+               padding: Optional[int] = None) -> dict:
+    """A gcsim share payload with character_details and some unrelated result data"""
+    details = []
+    for name in _names(rng, characters):
+        _, stats = character_stats(rng, rng.random() >= invalid_rate)
+        set_name = rng.choice(FOUR_STAR_SETS if rng.random()
+                              < four_star_rate else FIVE_STAR_SETS)
+        details.append({"name": name, "level": 90, "max_level": 90, "cons": 0,
+                        "weapon": {"name": "favoniuslance", "refine": 3, "level": 90, "max_level": 90},
+                        "talents": {"attack": 9, "skill": 9, "burst": 9},
+                        "stats": stats, "sets": {set_name: 4}})
+    return {
+        "schema_version": {"major": 4, "minor": 0},
+        "sim_version": "synthetic",
+        "character_details": details,
+        "statistics": {"dps": {"mean": rng.uniform(20000, 60000)},
+                       "samples": [rng.random() for _ in range(padding if padding is not None else 256)]},
+    }
+
+
+def corpus(rng: random.Random, characters: int, per_config: int = 4, **kwargs) -> list[str]:
+    """Configs holding the given number of characters in total"""
+    configs = []
+    while characters > 0:
+        n = min(per_config, characters)
+        configs.append(config(rng, n, **kwargs))
+        characters -= n
+    return configs
+
+
+def _names(rng: random.Random, characters: int) -> list[str]:
+    if characters <= len(CHARACTERS):
+        return rng.sample(CHARACTERS, characters)
+    return [f"{rng.choice(CHARACTERS)}{'abcdefghijklmnop'[i % 16] * (i // 16 + 1)}" for i in range(characters)]
@@ -0,0 +1,67 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from KQMCArchive import ARCHIVE_ERRORS, documents
+
+CONFIGS = {"a.txt": "hutao add stats hp=4780;\n", "dir/b.txt": "xingqiu add stats atk=311;\n"}
+
+
+def write_tar(path, members: dict, mode="w:gz"):
+    with tarfile.open(path, mode) as archive:
+        directory = tarfile.TarInfo("dir")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, content in members.items():
+            data = content if isinstance(content, bytes) else content.encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+def test_tar_members_are_configs(tmp_path):
+    path = tmp_path / "team.tar.gz"
+    write_tar(path, CONFIGS)
+
+    assert list(documents(str(path))) == [("team.tar.gz:a.txt", CONFIGS["a.txt"]),
+                                          ("team.tar.gz:dir/b.txt", CONFIGS["dir/b.txt"])]
+
+
+def test_zip_members_are_configs(tmp_path):
+    path = tmp_path / "team.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("dir/", "")
+        for name, content in CONFIGS.items():
+            archive.writestr(name, content)
+
+    assert list(documents(str(path))) == [("team.zip:a.txt", CONFIGS["a.txt"]),
+                                          ("team.zip:dir/b.txt", CONFIGS["dir/b.txt"])]
+
+
+def test_bundles_are_split_on_nul(tmp_path):
+    path = tmp_path / "configs.bin"
+    path.write_bytes(b"\0".join(c.encode() for c in CONFIGS.values()) + b"\0\n\0")
+
+    assert list(documents(str(path), bundle=True)) == [("configs.bin:0", CONFIGS["a.txt"]),
+                                                       ("configs.bin:1", CONFIGS["dir/b.txt"])]
+    with pytest.raises(ValueError):
+        documents(str(path))
+
+
+def test_members_that_are_not_utf8_are_skipped(tmp_path, capsys):
+    path = tmp_path / "team.tar"
+    write_tar(path, {"bad.txt": b"\xff\xfe", "a.txt": CONFIGS["a.txt"]}, mode="w")
+
+    assert [name for name, _ in documents(str(path))] == ["team.tar:a.txt"]
+    assert "Skipping team.tar:bad.txt" in capsys.readouterr().err
+
+
+def test_truncated_archives_raise_archive_errors(tmp_path):
+    path = tmp_path / "team.tar.gz"
+    write_tar(path, CONFIGS)
+    path.write_bytes(path.read_bytes()[:40])
+
+    with pytest.raises(ARCHIVE_ERRORS):
+        list(documents(str(path)))
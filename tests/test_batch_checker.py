@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import KQMCChecker as checker  # noqa: E402
+from KQMCBatchChecker import check_batch, stats_matrix  # noqa: E402
+from KQMCChecker import ArtifactStats, MAIN_STAT_COMBINATIONS  # noqa: E402
+from Stats import Stat, main_values, avg_sub_values  # noqa: E402
+
+SUB_STATS = [stat for stat in Stat if avg_sub_values[stat] is not None]
+
+
+def random_build(rng: random.Random) -> ArtifactStats:
+    """A character with random main stats and a random whole number of rolls per sub stat"""
+    build = ArtifactStats()
+    for stat in rng.choice(MAIN_STAT_COMBINATIONS):
+        build.stats[stat] += main_values[stat]
+    subs = {stat: 2 for stat in SUB_STATS}
+    for _ in range(checker.MAX_SUBS_TOTAL - sum(subs.values()) + rng.randint(-1, 1)):
+        subs[rng.choice(SUB_STATS)] += 1
+    for stat, count in subs.items():
+        build.stats[stat] += count * avg_sub_values[stat]
+    if rng.random() < 0.2:
+        build.stats[rng.choice(SUB_STATS)] *= 1.05
+    return build
+
+
+def guess_is_valid(build: ArtifactStats, guess) -> bool:
+    try:
+        subs = checker.get_subs_from_guess(build, guess)
+    except ValueError:
+        return False
+    return checker.checkKQMC(guess, subs)[0]
+
+
+def test_check_batch_matches_the_per_character_checker():
+    rng = random.Random(2)
+    builds = [random_build(rng) for _ in range(300)]
+
+    valid, first = check_batch(stats_matrix(builds), chunk_size=64)
+
+    assert 0 < valid.sum() < len(builds)
+    for build, is_valid, index in zip(builds, valid, first):
+        guesses = checker.guess_main_stats(build)
+        assert is_valid == any(guess_is_valid(build, guess) for guess in guesses)
+        assert is_valid == (checker.check_character("test", build).verdict == checker.VALID)
+        if is_valid:
+            assert guess_is_valid(build, MAIN_STAT_COMBINATIONS[index])
+        else:
+            assert index == -1
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("aiohttp")
+
+import KQMCCheckerDiscordBot as bot  # noqa: E402
+from KQMCChecker import INVALID, VALID, CharacterResult, ConfigResult  # noqa: E402
+
+
+def result(url: str, valid: bool) -> ConfigResult:
+    return ConfigResult(url, [CharacterResult("hutao", VALID if valid else INVALID, "isn't valid KQMC mains/substats")])
+
+
+def links(count: int) -> list[str]:
+    return [f"https://gcsim.app/db/link{i:04d}" for i in range(count)]
+
+
+def test_small_batch_fits_into_one_message():
+    urls = links(3)
+    reply, report = bot.batch_report(urls, [result(urls[0], True), result(urls[1], False), None])
+    assert report is None
+    assert reply.startswith("Checked 3 links: 1 KQMC valid, 1 not KQMC valid, 1 invalid")
+    assert urls[1] in reply and urls[2] in reply and urls[0] not in reply
+
+
+def test_large_batch_is_cut_short_and_attached():
+    urls = links(100)
+    results = [result(url, i % 4 == 0) if i % 10 else None for i, url in enumerate(urls)]
+    reply, report = bot.batch_report(urls, results, skipped=20)
+    assert len(reply) <= bot.MESSAGE_LIMIT
+    assert "Only the first 100 links were checked, 20 more were left out" in reply
+    assert all(url in report for url in urls)
+    failures = [url for url, r in zip(urls, results) if r is None or not r.valid]
+    shown = [url for url in failures if url in reply]
+    assert shown == failures[:len(shown)]
+    assert reply.endswith(f"... and {len(failures) - len(shown)} more, see the attached report")
+
+
+def test_links_are_found_once_in_order():
+    text = ("https://gcsim.app/db/b1 and https://gcsim.app/sh/a-2, again https://gcsim.app/db/b1\n"
+            "https://example.com/db/c3 https://gcsim.app/db/c3")
+    assert bot.find_links(text) == ["https://gcsim.app/db/b1", "https://gcsim.app/sh/a-2", "https://gcsim.app/db/c3"]
+
+
+def test_long_reply_is_cut_at_a_line_and_attached():
+    text = "\n".join(f"line {i}" for i in range(1000))
+    reply, report = bot.fit_message(text)
+    assert len(reply) <= bot.MESSAGE_LIMIT
+    assert report == text
+    assert text.startswith(reply.rsplit("\n", 1)[0])
+    assert bot.fit_message("short") == ("short", None)
+
+
+def test_limiter_reserves_room_for_a_batch_at_once():
+    limiter = bot.CheckLimiter(max_inflight=2, max_queued=3)
+    assert limiter.try_reserve(4)
+    assert not limiter.try_reserve(2)
+    assert limiter.try_reserve(1)
+    assert limiter.full()
+    limiter.release(4)
+    assert limiter.try_reserve(4) and limiter.full()
+
+
+class FakeFetcher:
+    def __init__(self, error=None, details=None):
+        self.error = error
+        self.details = details
+        self.calls = 0
+
+    async def get_character_details(self, url):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.details
+
+
+def http_error(status: int):
+    return bot.aiohttp.ClientResponseError(None, (), status=status)
+
+
+@pytest.fixture
+def share_cache(monkeypatch):
+    cache = bot.TTLCache(16)
+    monkeypatch.setattr(bot, "share_cache", cache)
+    return cache
+
+
+@pytest.mark.parametrize("error", [http_error(404), ValueError("Expecting value")])
+def test_missing_or_unreadable_shares_are_cached_as_invalid(share_cache, monkeypatch, error):
+    monkeypatch.setattr(bot, "fetcher", FakeFetcher(error))
+    url = "https://gcsim.app/db/missing"
+    assert asyncio.run(bot.check_share(url, bot.share_key(url))) is None
+    assert share_cache.get(bot.share_key(url)) is None
+
+
+@pytest.mark.parametrize("error", [http_error(503), asyncio.TimeoutError(), bot.aiohttp.ClientConnectionError()])
+def test_transient_errors_are_raised_and_not_cached(share_cache, monkeypatch, error):
+    monkeypatch.setattr(bot, "fetcher", FakeFetcher(error))
+    url = "https://gcsim.app/db/flaky"
+    with pytest.raises(type(error)):
+        asyncio.run(bot.check_share(url, bot.share_key(url)))
+    assert share_cache.get(bot.share_key(url)) is bot.MISSING
+
+
+def test_batch_reports_links_that_could_not_be_checked(share_cache, monkeypatch):
+    monkeypatch.setattr(bot, "fetcher", FakeFetcher(http_error(502)))
+    urls = links(2)
+    results = asyncio.run(bot.check_links(urls, 2))
+    assert results == [bot.FAILED, bot.FAILED]
+    reply, report = bot.batch_report(urls, results)
+    assert report is None
+    assert reply.startswith("Checked 2 links: 0 KQMC valid, 0 not KQMC valid, 2 could not be checked")
+    assert f"{urls[0]} could not be checked" in reply
+    assert "invalid" not in reply
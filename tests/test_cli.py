@@ -0,0 +1,147 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from KQMCChecker import parse_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALID = """
+hutao char lvl=90/90 cons=0 talent=9,9,9;
+hutao add set="emblemofseveredfate" count=4;
+hutao add stats hp=4780.0 atk=311.0 er=0.518 def%=0.583 hp%=0.466; # main
+hutao add stats def%=0.433755 def=78.71 hp=507.875 hp%=0.19822 atk=49.5975 atk%=0.148665 er=0.2754 em=118.881 cr=0.06613 cd=0.26418;
+"""
+INVALID = VALID.replace("cr=0.06613", "cr=0.36613")
+
+
+def run_cli(*args, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, os.path.join(ROOT, "KQMCChecker.py"), *args],
+                          capture_output=True, text=True, cwd=ROOT, **kwargs)
+
+
+def verdicts(stdout: str) -> list:
+    return re.findall(r"^'(.+)' is (not )?KQMC valid", stdout, re.MULTILINE)
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    """Keeps the result cache of the CLI out of the home directory"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def configs(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"config{i}.txt"
+        path.write_text(INVALID if i % 3 == 1 else VALID)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("jobs", [[], ["-j", "3"]])
+def test_results_are_printed_in_input_order(configs, jobs):
+    result = run_cli(*jobs, *configs)
+
+    assert verdicts(result.stdout) == [(f"config{i}.txt", "not " if i % 3 == 1 else "") for i in range(6)]
+    assert result.returncode == 1
+
+
+def test_exit_status_is_zero_when_every_file_is_valid(configs):
+    valid = [path for i, path in enumerate(configs) if i % 3 != 1]
+
+    assert run_cli("-j", "2", *valid).returncode == 0
+    assert run_cli("-j", "2", *valid, configs[0] + ".missing").returncode == 1
+
+
+def test_unordered_reports_every_file(configs):
+    result = run_cli("-j", "3", "--unordered", *configs)
+
+    assert sorted(verdicts(result.stdout)) == [(f"config{i}.txt", "not " if i % 3 == 1 else "") for i in range(6)]
+
+
+def test_stdin_reads_filenames_one_per_line(configs):
+    result = run_cli("--stdin", configs[0], input="\n".join(configs[1:3]) + "\n")
+
+    assert verdicts(result.stdout) == [("config0.txt", ""), ("config1.txt", "not "), ("config2.txt", "")]
+
+
+def test_null_separates_stdin_filenames_by_nul(configs):
+    result = run_cli("--stdin", "-0", input="\0".join(configs[:2]))
+
+    assert verdicts(result.stdout) == [("config0.txt", ""), ("config1.txt", "not ")]
+
+
+def test_stdin_configs_reads_nul_separated_documents():
+    result = run_cli("--stdin-configs", input=VALID + "\0" + INVALID)
+
+    assert verdicts(result.stdout) == [("<stdin>:0", ""), ("<stdin>:1", "not ")]
+    assert result.returncode == 1
+
+
+def test_jsonl_prints_one_object_per_file(configs):
+    result = run_cli("--jsonl", "-j", "2", *configs[:2], configs[0] + ".missing")
+
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [(line["name"], line["valid"]) for line in lines[:2]] == [("config0.txt", True), ("config1.txt", False)]
+    assert lines[1]["characters"][0]["name"] == "hutao"
+    assert lines[1]["characters"][0]["verdict"] == "invalid"
+    assert "guess" in lines[0]["characters"][0] and "subs" in lines[0]["characters"][0]
+    assert lines[2]["valid"] is False and "error" in lines[2]
+
+
+def test_results_are_cached_by_content(configs, tmp_path):
+    run_cli(*configs[:2])
+    assert not (tmp_path / "cache").exists()
+
+    assert "0 hits, 2 misses" in run_cli("--cache", *configs[:2]).stderr
+
+    result = run_cli("--cache", *configs[:2])
+    assert "2 hits, 0 misses" in result.stderr
+    assert verdicts(result.stdout) == [("config0.txt", ""), ("config1.txt", "not ")]
+
+    with open(configs[0], "a") as f:
+        f.write("# edited\n")
+    assert "1 hits, 1 misses" in run_cli("--cache", *configs[:2]).stderr
+
+
+def test_archives_and_bundles_are_checked_member_by_member(tmp_path):
+    archive = tmp_path / "team.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("good.txt", VALID)
+        z.writestr("bad.txt", INVALID)
+    bundle = tmp_path / "configs.bin"
+    bundle.write_text(INVALID + "\0" + VALID)
+
+    result = run_cli("-j", "2", "--bundle", str(archive), str(bundle))
+
+    assert verdicts(result.stdout) == [("team.zip:good.txt", ""), ("team.zip:bad.txt", "not "),
+                                       ("configs.bin:0", "not "), ("configs.bin:1", "")]
+    assert result.returncode == 1
+
+
+def test_gcsim_results_are_checked_by_their_character_details(tmp_path):
+    details = [{"name": name, "stats": list(stats.stats), "sets": {s.name: s.count for s in stats.sets}}
+               for name, stats in parse_config(INVALID).items()]
+    result = tmp_path / "result.json"
+    result.write_text(json.dumps({"config_file": VALID, "character_details": details, "statistics": {}}))
+
+    assert verdicts(run_cli(str(result)).stdout) == [("result.json", "not ")]
+
+
+@pytest.mark.parametrize("jobs", [[], ["-j", "2"], ["--cache"], ["--cache", "-j", "2"]])
+def test_a_file_that_is_not_utf8_fails_alone(configs, tmp_path, jobs):
+    binary = tmp_path / "binary.txt"
+    binary.write_bytes(b"hutao add stats hp=\xff\xfe;\n")
+
+    result = run_cli(*jobs, configs[0], str(binary), configs[2])
+
+    assert verdicts(result.stdout) == [("config0.txt", ""), ("config2.txt", "")]
+    assert f"exception occured while processing {binary}" in result.stderr
+    assert result.returncode == 1
@@ -0,0 +1,144 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from contextlib import contextmanager
+
+import pytest
+
+import KQMCDaemon
+from KQMCDaemon import DaemonError, check_in_process, request_daemon
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALID_CONFIG = """
+hutao char lvl=90/90 cons=0 talent=9,9,9;
+hutao add stats hp=4780.0 atk=311.0 er=0.518 def%=0.583 hp%=0.466; # main
+hutao add stats def%=0.433755 def=78.71 hp=507.875 hp%=0.19822 atk=49.5975 atk%=0.148665 er=0.2754 em=118.881 cr=0.06613 cd=0.26418;
+"""
+INVALID_CONFIG = VALID_CONFIG.replace("cr=0.06613", "cr=0.36613")
+REQUEST = {"configs": [{"name": "good.txt", "text": VALID_CONFIG}, {"name": "bad.txt", "text": INVALID_CONFIG}]}
+
+
+@contextmanager
+def running_daemon(*args):
+    """Address of a check daemon running in a subprocess, started with args"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        address = f"127.0.0.1:{s.getsockname()[1]}"
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "KQMCDaemon.py"), "--address", address, "serve",
+                                *args], cwd=ROOT, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                with urllib.request.urlopen(f"http://{address}/health", timeout=1) as r:
+                    assert json.loads(r.read())["ok"]
+                break
+            except OSError:
+                time.sleep(0.05)
+        yield address
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture
+def daemon():
+    with running_daemon() as address:
+        yield address
+
+
+def test_daemon_answers_like_the_in_process_check(daemon):
+    results = request_daemon(REQUEST, daemon)
+
+    assert results == check_in_process(REQUEST)
+    assert [r["valid"] for r in results] == [True, False]
+
+
+def test_daemon_errors_are_raised(daemon):
+    with pytest.raises(DaemonError, match="400"):
+        request_daemon({"configs": [{"name": "no text"}]}, daemon)
+
+    results = request_daemon({"configs": [{"name": "bad.txt", "text": "hutao add stats atk=;"}]}, daemon)
+    assert results[0]["valid"] is False and results[0]["error"]
+
+
+def test_a_config_that_cannot_be_checked_fails_alone():
+    results = check_in_process({"configs": [{"name": "bad.txt", "text": "hutao add stats atk=;"},
+                                            {"name": "good.txt", "text": VALID_CONFIG}]})
+
+    assert [r["name"] for r in results] == ["bad.txt", "good.txt"]
+    assert results[0]["valid"] is False and results[0]["error"]
+    assert results[1]["valid"] is True and "error" not in results[1]
+
+
+def test_client_checks_in_process_without_a_daemon(tmp_path, capsys):
+    (tmp_path / "good.txt").write_text(VALID_CONFIG)
+    (tmp_path / "bad.txt").write_text(INVALID_CONFIG)
+    (tmp_path / "broken.txt").write_text("hutao add stats atk=;")
+
+    # nothing listens on port 9 of localhost
+    code = KQMCDaemon.main(["--address", "127.0.0.1:9", "check",
+                            *(str(tmp_path / name) for name in ("good.txt", "bad.txt", "broken.txt"))])
+
+    captured = capsys.readouterr()
+    assert code == 1
+    assert "'good.txt' is KQMC valid" in captured.out
+    assert "'bad.txt' is not KQMC valid" in captured.out
+    assert "exception occured while processing broken.txt" in captured.err
+
+
+def test_client_with_other_rules_than_the_daemon_checks_in_process(daemon, tmp_path):
+    path = tmp_path / "good.txt"
+    path.write_text(VALID_CONFIG)
+
+    def check(*args):
+        return subprocess.run([sys.executable, os.path.join(ROOT, "KQMCDaemon.py"), "--address", daemon, "check",
+                               *args, str(path)], capture_output=True, text=True, cwd=ROOT)
+
+    result = check()
+    assert "'good.txt' is KQMC valid" in result.stdout
+    assert "checking in this process" not in result.stderr
+
+    result = check("--exact")
+    assert "'good.txt' is KQMC valid" in result.stdout
+    assert "checking in this process" in result.stderr
+
+
+def check_through(address, *args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "KQMCDaemon.py"), "--address", address, "check", *args],
+                          capture_output=True, text=True, cwd=ROOT)
+
+
+def test_client_asks_the_daemon_without_importing_the_checker(daemon, tmp_path):
+    path = tmp_path / "good.txt"
+    path.write_text(VALID_CONFIG)
+    code = ("import sys, KQMCDaemon\n"
+            f"code = KQMCDaemon.main(['--address', {daemon!r}, 'check', {str(path)!r}])\n"
+            "assert 'KQMCChecker' not in sys.modules and 'Stats' not in sys.modules, sorted(sys.modules)\n"
+            "sys.exit(code)")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 0, result.stderr
+    assert "'good.txt' is KQMC valid" in result.stdout
+
+
+def test_client_checks_in_process_when_the_rules_changed(tmp_path):
+    with open(os.path.join(ROOT, "rules", "kqmc.json")) as file:
+        rules = json.load(file)
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps(rules))
+    path = tmp_path / "good.txt"
+    path.write_text(VALID_CONFIG)
+
+    with running_daemon("--rules", str(rules_path)) as address:
+        result = check_through(address, "--rules", str(rules_path), str(path))
+        assert "'good.txt' is KQMC valid" in result.stdout
+        assert "checking in this process" not in result.stderr
+
+        rules_path.write_text(json.dumps(rules, indent=1))
+        result = check_through(address, "--rules", str(rules_path), str(path))
+        assert "'good.txt' is KQMC valid" in result.stdout
+        assert "checking in this process" in result.stderr
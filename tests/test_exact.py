@@ -0,0 +1,55 @@
+import KQMCChecker as checker
+from KQMCChecker import VALID, INVALID, check_character, parse_config, possible_roll_counts, roll_count_table
+from Stats import Stat, max_sub_values
+
+SUB_STATS = {Stat.defd_pcnt: "def%", Stat.defd: "def", Stat.hp: "hp", Stat.hp_pcnt: "hp%", Stat.atk: "atk",
+             Stat.atk_pcnt: "atk%", Stat.er: "er", Stat.em: "em", Stat.cr: "cr", Stat.cd: "cd"}
+MAINS = "hp=4780 atk=311 atk%=0.466 pyro%=0.466 cr=0.311"
+
+
+def config(rolls: dict) -> str:
+    """One character whose substats are whole max rolls, rolls[stat] of them"""
+    subs = " ".join(f"{text}={rolls.get(stat, 4) * max_sub_values[stat]}" for stat, text in SUB_STATS.items())
+    return f"hutao add stats {MAINS};\nhutao add stats {subs};\n"
+
+
+def check(text: str):
+    return check_character("hutao", parse_config(text)["hutao"])
+
+
+def test_roll_count_table():
+    table = roll_count_table()
+
+    assert table[70] == table[100] == 1 << 1
+    assert table[56] == 1 << 1  # one low 4* roll
+    assert table[69] == table[101] == 0
+    assert table[170] & (1 << 2)
+    assert table[400] == 0b11110000  # 4 to 7 rolls
+
+
+def test_possible_roll_counts_within_tolerance():
+    unit = max_sub_values[Stat.cr] / 100
+
+    assert possible_roll_counts(Stat.cr, 170 * unit, 0) == 1 << 2
+    assert possible_roll_counts(Stat.cr, 40 * unit, unit / 2) == 0
+
+
+def test_max_rolls_are_only_valid_with_exact(monkeypatch):
+    text = config({})
+
+    assert check(text).verdict == INVALID
+    monkeypatch.setattr(checker, "EXACT", True)
+    assert check(text).verdict == VALID
+
+
+def test_exact_still_applies_the_kqmc_limits(monkeypatch):
+    monkeypatch.setattr(checker, "EXACT", True)
+
+    # 14 rolls of flat defense, at most 12 are allowed when it is not a main stat
+    result = check(config({Stat.defd: 14, Stat.defd_pcnt: 2, Stat.hp: 2, Stat.hp_pcnt: 2, Stat.atk: 2, Stat.cd: 2}))
+    assert result.verdict == INVALID
+    assert result.guesses[-1].failure.kind == "roll_bounds"
+    # 113% of a max roll of crit damage is not a sum of roll tiers
+    result = check(config({Stat.cd: 1.13}))
+    assert result.verdict == INVALID
+    assert result.guesses[-1].failure.kind == "rolls"
@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from KQMCGit import GitDiff, GitError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALID = """
+hutao add stats hp=4780.0 atk=311.0 er=0.518 def%=0.583 hp%=0.466; # main
+hutao add stats def%=0.433755 def=78.71 hp=507.875 hp%=0.19822 atk=49.5975 atk%=0.148665 er=0.2754 em=118.881 cr=0.06613 cd=0.26418;
+"""
+INVALID = VALID.replace("cr=0.06613", "cr=0.36613")
+
+
+def git(repo, *args):
+    env = {**os.environ, "GIT_AUTHOR_NAME": "test", "GIT_AUTHOR_EMAIL": "test@example.com",
+           "GIT_COMMITTER_NAME": "test", "GIT_COMMITTER_EMAIL": "test@example.com"}
+    subprocess.run(["git", *args], cwd=repo, env=env, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repository whose last commit changes a.txt, removes b.txt and adds d.txt"""
+    git(tmp_path, "init", "-q")
+    (tmp_path / "a.txt").write_text(VALID)
+    (tmp_path / "b.txt").write_text(VALID)
+    (tmp_path / "notes.md").write_text("not a config")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "base")
+    (tmp_path / "a.txt").write_text(INVALID)
+    (tmp_path / "b.txt").unlink()
+    (tmp_path / "d.txt").write_text(VALID)
+    (tmp_path / "notes.md").write_text("still not a config")
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "head")
+    return tmp_path
+
+
+def test_only_added_and_modified_configs_are_listed(repo):
+    diff = GitDiff.open("HEAD~1..HEAD", repo=str(repo))
+
+    assert diff.paths == ["a.txt", "d.txt"]
+    assert list(diff.documents(diff.head)) == [("a.txt", INVALID), ("d.txt", VALID)]
+    assert list(diff.documents(diff.base)) == [("a.txt", VALID)]
+
+
+def test_configs_that_are_not_utf8_are_skipped(repo, capsys):
+    (repo / "e.txt").write_bytes(b"hutao add stats atk=\xff;")
+    git(repo, "add", "e.txt")
+    git(repo, "commit", "-q", "-m", "binary")
+    diff = GitDiff.open("HEAD~2..HEAD", repo=str(repo))
+
+    assert diff.paths == ["a.txt", "d.txt", "e.txt"]
+    assert list(diff.documents(diff.head)) == [("a.txt", INVALID), ("d.txt", VALID)]
+    assert "Skipping e.txt, it is not UTF-8 text" in capsys.readouterr().err
+
+
+def test_unknown_revisions_raise_git_errors(repo):
+    with pytest.raises(GitError):
+        GitDiff.open("nope..HEAD", repo=str(repo))
+
+
+def run_cli(repo, *args) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, os.path.join(ROOT, "KQMCChecker.py"), *args],
+                          capture_output=True, text=True, cwd=repo)
+
+
+def test_verdict_changes_are_reported(repo):
+    result = run_cli(repo, "--git-diff", "HEAD~1..HEAD", "--verdict-changes")
+
+    assert result.returncode == 1
+    assert "'a.txt' is not KQMC valid" in result.stdout
+    assert "'d.txt' is KQMC valid" in result.stdout
+    assert "b.txt" not in result.stdout
+    assert "hutao valid -> invalid" in result.stdout
+
+
+def test_verdict_changes_in_jsonl(repo):
+    result = run_cli(repo, "--git-diff", "HEAD~1..HEAD", "--verdict-changes", "--jsonl")
+
+    lines = {line["name"]: line for line in map(json.loads, result.stdout.splitlines())}
+    assert lines["a.txt"]["verdict_changes"] == [
+        {"standard": "KQMC", "character": "hutao", "base": "valid", "head": "invalid"}]
+    assert lines["d.txt"]["valid"] is True
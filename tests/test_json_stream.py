@@ -0,0 +1,81 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from JsonStream import TopLevelArrayScanner, read_character_details, read_character_details_async
+
+DETAILS = [
+    {"name": "hutao", "note": "brackets ] [ } { and \"quotes\" in a string", "path": "C:\\configs\\"},
+    {"name": "zhongli", "stats": [0.1, 2e-3, -4], "sets": {"tenacity": 4}, "title": "岩王帝君"},
+]
+DETAILS_JSON = json.dumps(DETAILS, ensure_ascii=False).encode()
+DOCUMENT = (b'{"config_file": "character_details = [1, 2]; \\"character_details\\"",\n'
+            b' "nested": {"character_details": "not this one", "list": [{"character_details": []}]},\n'
+            b' "character_details": ' + DETAILS_JSON + b',\n'
+            b' "statistics": {"dps": [1, 2, 3]}}')
+
+
+class CountingStream(io.BytesIO):
+    """A stream that remembers how far it was read"""
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed = self.tell()
+        return data
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_finds_the_top_level_array_in_any_chunking(chunk_size):
+    details = read_character_details(io.BytesIO(DOCUMENT), chunk_size)
+    assert details == DETAILS_JSON
+    assert json.loads(details) == DETAILS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_async_reader_returns_the_same_bytes(chunk_size):
+    async def chunks():
+        for chunk in chunked(DOCUMENT, chunk_size):
+            yield chunk
+
+    assert asyncio.run(read_character_details_async(chunks())) == DETAILS_JSON
+
+
+def test_reading_stops_after_the_array():
+    stream = CountingStream(DOCUMENT)
+    read_character_details(stream, 16)
+    assert stream.consumed < DOCUMENT.index(DETAILS_JSON) + len(DETAILS_JSON) + 16
+
+
+@pytest.mark.parametrize("document", [
+    b'{"config_file": "x", "statistics": {}}',
+    b'{"nested": {"character_details": [1, 2]}}',
+    b'{"config_file": "\\"character_details\\": [1]"}',
+    b'[{"character_details": [1]}]',
+    b'{"character_details": null}',
+])
+def test_missing_top_level_key(document):
+    for size in (1, 1 << 16):
+        assert read_character_details(io.BytesIO(document), size) is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1 << 16])
+def test_truncated_array(chunk_size):
+    document = DOCUMENT[:DOCUMENT.index(b'"zhongli"')]
+    assert read_character_details(io.BytesIO(document), chunk_size) is None
+
+
+def test_scanner_reports_the_chunk_that_completes_the_array():
+    details = json.dumps([{"name": "x" * 50, "stats": list(range(30))}] * 200).encode()
+    chunks = chunked(b'{"character_details": ' + details + b', "statistics": {}}', 64)
+    scanner = TopLevelArrayScanner()
+    done = [scanner.feed(chunk) for chunk in chunks]
+    completed = done.index(True)
+    assert all(done[completed:])
+    assert len(b"".join(chunks[:completed])) < len(b'{"character_details": ' + details)
+    assert scanner.raw() == details
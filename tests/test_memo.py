@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+import KQMCChecker as checker
+from BuildMemo import BuildMemo
+from KQMCChecker import BUILD_QUANTUM, ArtifactStats, check_character
+from Stats import Stat
+
+
+def build(offset: float = 0.0) -> ArtifactStats:
+    stats = [0.0] * len(Stat)
+    for stat, value in ((Stat.hp, 4780.0 + 507.875), (Stat.atk, 311.0 + 49.5975), (Stat.er, 0.518 + 0.2754),
+                        (Stat.defd_pcnt, 0.583 + 0.433755), (Stat.hp_pcnt, 0.466 + 0.19822), (Stat.defd, 78.71),
+                        (Stat.atk_pcnt, 0.148665), (Stat.em, 118.881), (Stat.cr, 0.06613), (Stat.cd, 0.26418)):
+        stats[stat] = value
+    stats[Stat.cr] += offset
+    return ArtifactStats(stats)
+
+
+def test_copies_that_differ_by_float_rounding_are_solved_once(monkeypatch):
+    monkeypatch.setattr(checker, "MEMO", BuildMemo())
+    first = check_character("hutao", build())
+    copy = check_character("hutao copy", build(BUILD_QUANTUM / 100))
+    assert (checker.MEMO.misses, checker.MEMO.hits) == (1, 1)
+    assert copy.name == "hutao copy"
+    assert copy.to_dict() == {**first.to_dict(), "name": "hutao copy"}
+
+
+def test_different_builds_are_solved_separately(monkeypatch):
+    monkeypatch.setattr(checker, "MEMO", BuildMemo())
+    check_character("hutao", build())
+    check_character("hutao", build(BUILD_QUANTUM * 10))
+    assert (checker.MEMO.misses, checker.MEMO.hits) == (2, 0)
+
+
+def test_saved_memos_are_loaded_again(tmp_path):
+    path = str(tmp_path / "memo.pickle")
+    memo = BuildMemo(path, max_entries=2)
+    for i in range(3):
+        memo.put(i, str(i))
+    memo.save()
+
+    assert BuildMemo(path).entries == {1: "1", 2: "2"}
+    (tmp_path / "memo.pickle").write_bytes(b"not a memo")
+    assert BuildMemo(path).entries == {}
+
+
+def test_memo_summary_is_printed_only_with_profile(tmp_path):
+    config = tmp_path / "team.txt"
+    config.write_text("""
+hutao add stats hp=4780.0 atk=311.0 er=0.518 def%=0.583 hp%=0.466; # main
+hutao add stats def%=0.433755 def=78.71 hp=507.875 hp%=0.19822 atk=49.5975 atk%=0.148665 er=0.2754 em=118.881 cr=0.06613 cd=0.26418;
+""")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def stderr(*args):
+        return subprocess.run([sys.executable, os.path.join(root, "KQMCChecker.py"), *args, str(config), str(config)],
+                              capture_output=True, text=True, cwd=root).stderr
+
+    assert "Builds:" not in stderr()
+    assert "Builds: 2 looked up, 1 solved" in stderr("--profile")
@@ -0,0 +1,43 @@
+import pytest
+
+from KQMCChecker import ArtifactSet, parse_config, parse_lines, preprocess_file
+from Stats import Stat
+
+
+def test_statements_joined_by_semicolons_are_all_parsed():
+    chars = parse_config('hutao add stats hp=4780 atk=311; hutao add stats cr=0.311;'
+                         ' hutao add set="crimsonwitchofflames" count=4; xingqiu add stats em=40;\n')
+
+    assert chars["hutao"].stats[Stat.hp] == 4780
+    assert chars["hutao"].stats[Stat.atk] == 311
+    assert chars["hutao"].stats[Stat.cr] == pytest.approx(0.311)
+    assert chars["hutao"].sets == [ArtifactSet("crimsonwitchofflames", 4)]
+    assert chars["xingqiu"].stats[Stat.em] == 40
+
+
+def test_comments_are_skipped():
+    chars = parse_config('# hutao add stats hp=1000;\n'
+                         'hutao add stats atk=311; # main; hutao add stats atk=1000;\n'
+                         'hutao add stats # cr=0.5\n'
+                         '  hutao add stats cd=0.622;\n')
+
+    assert chars["hutao"].stats[Stat.hp] == 0
+    assert chars["hutao"].stats[Stat.atk] == 311
+    assert chars["hutao"].stats[Stat.cr] == 0
+    assert chars["hutao"].stats[Stat.cd] == pytest.approx(0.622)
+
+
+def test_only_add_stats_and_add_set_start_a_statement():
+    chars = parse_config('hutao char lvl=90/90 cons=0 talent=9,9,9;\n'
+                         'hutao add weapon="staffofhoma" refine=1 lvl=90/90;\n'
+                         'options iteration=1000; hutao add stats em=20;\n')
+
+    assert list(chars) == ["hutao"]
+    assert chars["hutao"].stats[Stat.em] == 20
+    assert chars["hutao"].sets == []
+
+
+def test_parse_lines_matches_parse_config():
+    config = 'hutao add stats hp=4780; # main\nhutao add stats er=0.1; hutao add stats em=40;\n'
+
+    assert parse_lines(preprocess_file(config)) == parse_config(config)
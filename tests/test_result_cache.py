@@ -0,0 +1,27 @@
+from ResultCache import ResultCache
+
+
+def test_a_stored_result_is_a_hit(tmp_path):
+    with ResultCache(str(tmp_path), "v1") as cache:
+        cache.put(cache.key("config"), {"valid": True})
+    with ResultCache(str(tmp_path), "v1") as cache:
+        assert cache.get(cache.key("config")) == {"valid": True}
+        assert cache.get(cache.key("other config")) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changing_the_version_invalidates_results(tmp_path):
+    with ResultCache(str(tmp_path), "v1") as cache:
+        cache.put(cache.key("config"), {"valid": True})
+    with ResultCache(str(tmp_path), "v2") as cache:
+        assert cache.get(cache.key("config")) is None
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    with ResultCache(str(tmp_path), "v1", max_entries=2) as cache:
+        for i in range(3):
+            cache.put(cache.key(str(i)), i)
+        cache.get(cache.key("0"))
+        cache.put(cache.key("3"), 3)
+    with ResultCache(str(tmp_path), "v1") as cache:
+        assert [cache.get(cache.key(str(i))) for i in range(4)] == [0, None, None, 3]
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import Stats
+from KQMCChecker import VALID, INVALID, check_config_result
+from Stats import DEFAULT_RULES_PATH, load_rules
+
+HUTAO = """
+hutao add stats hp=4780.0 atk=311.0 er=0.518 def%=0.583 hp%=0.466; # main
+hutao add stats def%=0.433755 def=78.71 hp=507.875 hp%=0.19822 atk=49.5975 atk%=0.148665 er=0.2754 em=118.881 cr=0.06613 cd=0.26418;
+"""
+
+
+@pytest.fixture
+def rules_dir(tmp_path):
+    """A copy of the KQMC rules and a stricter variant that extends them"""
+    shutil.copy(DEFAULT_RULES_PATH, tmp_path / "base.json")
+    (tmp_path / "strict.json").write_text(json.dumps(
+        {"format": 1, "extends": "base.json", "name": "Strict", "allocated_subs_per_stat": 3}))
+    return tmp_path
+
+
+def rewrite(path, **changes):
+    """Changes values of a rules file and moves its modification time, like an edit would"""
+    data = json.loads(path.read_text())
+    data.update(changes)
+    path.write_text(json.dumps(data, indent=2))
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_extends_overrides_only_the_values_it_lists(rules_dir):
+    base = load_rules(str(rules_dir / "base.json"), cache=False)
+    strict = load_rules(str(rules_dir / "strict.json"), cache=False)
+    assert strict.name == "Strict"
+    assert strict.allocated_subs_per_stat == 3
+    assert base.allocated_subs_per_stat == 2
+    assert strict.max_subs_total == base.max_subs_total
+    assert strict.main_values == base.main_values
+    assert strict.max_subs == tuple(3 + 2 * (5 - mains) for mains in range(6))
+    # hutao has only 2 crit rate substats
+    assert check_config_result(HUTAO, rules=base).characters[0].verdict == VALID
+    assert check_config_result(HUTAO, rules=strict).characters[0].verdict == INVALID
+
+
+def test_extends_cycles_are_rejected(tmp_path):
+    (tmp_path / "a.json").write_text(json.dumps({"format": 1, "extends": "b.json"}))
+    (tmp_path / "b.json").write_text(json.dumps({"format": 1, "extends": "a.json"}))
+    with pytest.raises(ValueError):
+        load_rules(str(tmp_path / "a.json"), cache=False)
+
+
+def test_compiled_rules_are_loaded_from_the_cache(rules_dir, monkeypatch):
+    path = str(rules_dir / "strict.json")
+    compiled = load_rules(path)
+    assert os.path.exists(rules_dir / "__pycache__" / f"strict.json.{Stats.RULES_FORMAT}.marshal")
+
+    def read_rules(*args):
+        raise AssertionError("the rules file was read again")
+
+    monkeypatch.setattr(Stats, "read_rules", read_rules)
+    cached = load_rules(path)
+    assert cached is not compiled
+    assert Stats._dump_rules(cached) == Stats._dump_rules(compiled)
+
+
+def test_cache_is_rebuilt_when_an_extended_file_changes(rules_dir):
+    path = str(rules_dir / "strict.json")
+    assert load_rules(path).max_subs_total == 40
+    rewrite(rules_dir / "base.json", max_subs_total=41)
+    assert load_rules(path).max_subs_total == 41
+    rewrite(rules_dir / "strict.json", allocated_subs_per_stat=1)
+    rules = load_rules(path)
+    assert (rules.allocated_subs_per_stat, rules.max_subs_total) == (1, 41)
+
+
+def test_no_cache_writes_nothing(rules_dir):
+    load_rules(str(rules_dir / "strict.json"), cache=False)
+    assert not (rules_dir / "__pycache__").exists()
+
+
+def test_rules_are_loaded_on_first_use(rules_dir):
+    env = {**os.environ, "KQMC_RULES": str(rules_dir / "strict.json")}
+    run = [sys.executable, "-c", "import sys, KQMCChecker; sys.argv[1:] and KQMCChecker.current_rules()"]
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    subprocess.run(run, env=env, cwd=cwd, check=True)
+    assert not (rules_dir / "__pycache__").exists()
+    subprocess.run(run + ["use"], env=env, cwd=cwd, check=True)
+    assert (rules_dir / "__pycache__").exists()
+
+
+def test_cache_is_rebuilt_when_the_compiler_changes(rules_dir, monkeypatch):
+    path = str(rules_dir / "strict.json")
+    load_rules(path)
+
+    monkeypatch.setattr(Stats, "RULES_COMPILER_VERSION", Stats.RULES_COMPILER_VERSION + 1)
+    read = []
+    read_rules = Stats.read_rules
+    monkeypatch.setattr(Stats, "read_rules", lambda *args: read.append(args[0]) or read_rules(*args))
+    load_rules(path)
+    assert path in read
+    read.clear()
+    load_rules(path)
+    assert read == []
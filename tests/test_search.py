@@ -0,0 +1,53 @@
+import KQMCChecker as checker
+from KQMCChecker import VALID, ArtifactStats, Failure, check_character, check_main_stats_possible, guess_main_stats, \
+    parse_config
+from Stats import Stat
+
+# atk% and hp% mains in sands and hat, so two guesses find the same subs
+SWAPPABLE = """
+hutao char lvl=90/90 cons=0 talent=9,9,9;
+hutao add stats hp=4780 atk=311 hp%=0.466 atk%=0.466 pyro%=0.466; # main
+hutao add stats def%=0.185895 def=39.355 hp=507.875 hp%=0.148665 atk=33.065 atk%=0.19822 er=0.22032 em=79.254 cr=0.26452 cd=0.52836;
+"""
+
+
+def build(**stats: float) -> ArtifactStats:
+    values = [0.0] * len(Stat)
+    for name, value in stats.items():
+        values[Stat[name]] = value
+    return ArtifactStats(values)
+
+
+def test_crit_hat_and_elemental_goblet_are_tried_first():
+    stats = build(hp=4780, atk=311, atk_pcnt=0.666, cr=0.511, pyro=0.466)
+    guesses = guess_main_stats(stats)
+    assert guesses[0] == (Stat.hp, Stat.atk, Stat.atk_pcnt, Stat.cr, Stat.pyro)
+    assert (Stat.hp, Stat.atk, Stat.cr, Stat.atk_pcnt, Stat.pyro) not in guesses  # no crit sands
+
+
+def test_search_finds_every_combination_the_stats_have_room_for():
+    rules = checker.RULES
+    stats = build(hp=4780, atk=311, atk_pcnt=0.666, hp_pcnt=0.966, cr=0.511, em=190, pyro=0.466)
+    capacity = [int(value * scale) for value, scale in zip(stats.stats, rules.capacity_scale)]
+    expected = {combo for combo in checker.MAIN_STAT_COMBINATIONS if check_main_stats_possible(combo, capacity)}
+    guesses = guess_main_stats(stats)
+    assert len(guesses) == len(set(guesses))
+    assert set(guesses) == expected
+
+
+def test_search_goes_on_after_a_guess_fails_the_kqmc_limits(monkeypatch):
+    stats = parse_config(SWAPPABLE)["hutao"]
+    first, second = guess_main_stats(stats)[:2]
+    assert sorted(first) == sorted(second)
+    kqmc_failure = checker._kqmc_failure
+
+    def fail_first(mains, subs, rules):
+        if tuple(mains) == first:
+            return Failure("total", (39, rules.max_subs_total))
+        return kqmc_failure(mains, subs, rules)
+
+    monkeypatch.setattr(checker, "_kqmc_failure", fail_first)
+    result = check_character("hutao", stats)
+    assert result.verdict == VALID
+    assert result.guess == second
+    assert result.guesses[0].guess == first and result.guesses[0].kqmc_failed
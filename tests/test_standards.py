@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+
+from KQMCChecker import INVALID, VALID, check_config_standards
+from Stats import DEFAULT_RULES_PATH, KURTC_RULES_PATH, load_rules
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEAM = """
+raiden char lvl=90/90 cons={raiden_cons} talent=9,9,9;
+raiden add weapon="engulfing" refine=1 lvl=90/90;
+raiden add set="emblem" count=4;
+bennett char lvl=90/90 cons=6 talent=9,9,9;
+bennett add weapon="aquila" refine={bennett_refine} lvl=90/90;
+bennett add set="noblesse" count=4;
+raiden add stats hp=4780.0 atk=311.0 em=186.5 def%=0.583 hp%=0.466; # main
+raiden add stats def%=0.24786 def=39.355 hp=761.8125 hp%=0.19822 atk=33.065 atk%=0.19822 er=0.2754 em=79.254 cr=0.26452 cd=0.26418;
+bennett add stats hp=4780.0 atk=311.0 er=0.518 cd=0.622 electro%=0.466; # main
+bennett add stats def%=0.37179 def=98.3875 hp=1015.75 hp%=0.148665 atk=66.13 atk%=0.148665 er=0.11016 em=79.254 cr=0.13226 cd=0.330225;
+"""
+
+
+def standards():
+    return [load_rules(DEFAULT_RULES_PATH), load_rules(KURTC_RULES_PATH)]
+
+
+def verdicts(raiden_cons=0, bennett_refine=1):
+    result = check_config_standards(TEAM.format(raiden_cons=raiden_cons, bennett_refine=bennett_refine),
+                                    standards(), "team.txt")
+    return {standard.standard: {c.name: (c.verdict, c.reason) for c in standard.characters}
+            for standard in result.standards}
+
+
+def test_kurtc_limits_five_star_constellations():
+    result = verdicts(raiden_cons=2)
+    assert result["KQMC"]["raiden"][0] == VALID
+    verdict, reason = result["KurtC"]["raiden"]
+    assert verdict == INVALID
+    assert "C2" in reason and "at most C0 for 5* characters" in reason
+
+
+def test_kurtc_allows_c6_four_stars_with_r3_weapons():
+    result = verdicts(bennett_refine=3)
+    assert result["KurtC"]["bennett"][0] == VALID
+    assert result["KurtC"]["raiden"][0] == VALID
+
+
+def test_kurtc_limits_weapon_refinement():
+    result = verdicts(bennett_refine=5)
+    assert result["KQMC"]["bennett"][0] == VALID
+    verdict, reason = result["KurtC"]["bennett"]
+    assert verdict == INVALID
+    assert "R5" in reason and "at most R3" in reason
+
+
+def test_kurt_flag_prints_a_verdict_per_standard(tmp_path):
+    path = tmp_path / "team.txt"
+    path.write_text(TEAM.format(raiden_cons=2, bennett_refine=1))
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "KQMCChecker.py"), "--kurt", str(path)],
+                            capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 1
+    out = result.stdout
+    assert "'team.txt' is KQMC valid" in out
+    assert "'team.txt' is not KurtC valid" in out
+    assert "raiden is C2 but KurtC allows at most C0" in out
+
+
+def test_kurtc_knows_recent_five_stars():
+    kurtc = load_rules(KURTC_RULES_PATH)
+    assert {"mizuki", "varesa", "escoffier", "skirk", "ineffa"} <= kurtc.five_star_characters
+    assert not kurtc.five_star_characters & kurtc.four_star_characters
+
+
+def test_kurtc_fails_characters_of_unknown_rarity():
+    result = check_config_standards(TEAM.format(raiden_cons=0, bennett_refine=1).replace("bennett", "newcomer"),
+                                    standards(), "team.txt")
+    verdicts = {standard.standard: {c.name: (c.verdict, c.reason) for c in standard.characters}
+                for standard in result.standards}
+    assert verdicts["KQMC"]["newcomer"][0] == VALID
+    verdict, reason = verdicts["KurtC"]["newcomer"]
+    assert verdict == INVALID
+    assert "unknown rarity" in reason
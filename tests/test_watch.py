@@ -0,0 +1,65 @@
+import os
+
+import KQMCWatch
+from KQMCWatch import Watcher
+
+HUTAO = """
+hutao add stats hp=4780.0 atk=311.0 er=0.518 def%=0.583 hp%=0.466; # main
+hutao add stats def%=0.433755 def=78.71 hp=507.875 hp%=0.19822 atk=49.5975 atk%=0.148665 er=0.2754 em=118.881 cr=0.06613 cd=0.26418;
+"""
+ZHONGLI = """
+zhongli add stats hp=4780.0 atk=311.0 hp%=0.466 atk%=0.932; # main
+zhongli add stats def%=0.24786 def=78.71 hp=761.8125 hp%=0.29733 atk=66.13 atk%=0.148665 er=0.22032 em=99.0675 cr=0.165325 cd=0.13209;
+"""
+
+
+def write(path, content: str):
+    path.write_text(content)
+    # the watcher compares mtime and size, make sure a rewrite in the same tick is seen
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_only_changed_characters_are_checked_again(tmp_path, monkeypatch):
+    checked = []
+    check_character = KQMCWatch.check_character
+    monkeypatch.setattr(KQMCWatch, "check_character",
+                        lambda char, *args: checked.append(char) or check_character(char, *args))
+    config = tmp_path / "team.txt"
+    write(config, HUTAO + ZHONGLI)
+    output = []
+    watcher = Watcher([str(config)], [], output=output.append)
+
+    watcher.poll(initial=True)
+    assert sorted(checked) == ["hutao", "zhongli"]
+    assert "'team.txt' is KQMC valid" in output[0]
+
+    checked.clear()
+    output.clear()
+    write(config, HUTAO.replace("cr=0.06613", "cr=0.36613") + ZHONGLI)
+    watcher.poll()
+    assert checked == ["hutao"]
+    assert "hutao valid -> invalid" in output[0]
+
+    checked.clear()
+    output.clear()
+    write(config, HUTAO.replace("cr=0.06613", "cr=0.36613") + ZHONGLI + "# only a comment changed\n")
+    watcher.poll()
+    assert checked == []
+    assert output == []
+
+
+def test_new_and_removed_files_are_reported(tmp_path):
+    output = []
+    watcher = Watcher([], [str(tmp_path / "*.txt")], rescan=0, output=output.append)
+    watcher.poll(initial=True)
+    assert watcher.watched == {}
+
+    config = tmp_path / "new.txt"
+    write(config, HUTAO)
+    watcher.poll()
+    assert any(line.endswith(f"{config}: hutao new -> valid") for line in output)
+
+    os.remove(config)
+    watcher.poll()
+    assert output[-1].endswith(f"{config} removed")